@@ -0,0 +1,151 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""A local stand-in for the arXiv API.
+
+The stub answers queries for DOIs like `all:"10.1234/x" OR all:...` with
+an Atom feed.  Every DOI whose CRC32 is even has a matching arXiv article,
+so the results are deterministic.  Point refmgr at it with the config
+option `complete.arxiv_url`.  Run `python benchmarks/arxiv_stub.py` to
+serve it on its own.
+"""
+
+import argparse
+import http.server
+import re
+import threading
+import urllib.parse
+import zlib
+from xml.sax.saxutils import escape
+
+
+FEED = '''<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom"
+      xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/"
+      xmlns:arxiv="http://arxiv.org/schemas/atom">
+<title>arXiv Query</title>
+<id>http://arxiv.org/api/stub</id>
+<updated>2021-01-01T00:00:00-05:00</updated>
+<opensearch:totalResults>{count}</opensearch:totalResults>
+<opensearch:startIndex>{start}</opensearch:startIndex>
+<opensearch:itemsPerPage>{count}</opensearch:itemsPerPage>
+{entries}</feed>
+'''
+
+ENTRY = '''<entry>
+<id>http://arxiv.org/abs/{arxiv_id}v1</id>
+<updated>2021-01-01T00:00:00Z</updated>
+<published>2021-01-01T00:00:00Z</published>
+<title>Article {arxiv_id}</title>
+<summary>Synthetic article.</summary>
+<author><name>A. Author</name></author>
+<arxiv:doi>{doi}</arxiv:doi>
+<link href="http://arxiv.org/abs/{arxiv_id}v1" rel="alternate" type="text/html"/>
+<arxiv:primary_category term="quant-ph" scheme="http://arxiv.org/schemas/atom"/>
+<category term="quant-ph" scheme="http://arxiv.org/schemas/atom"/>
+</entry>
+'''
+
+_DOI = re.compile(r'all:"?([^" ]+)"?')
+
+
+def arxiv_id(doi):
+    """Return the arXiv identifier of the article with `doi` or `None` if
+    there is none."""
+    checksum = zlib.crc32(doi.lower().encode('utf-8'))
+    if checksum % 2:
+        return None
+    return f'{2000 + checksum % 300}.{checksum % 100000:05d}'
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        start = int(query.get('start', ['0'])[0])
+        search_query = query.get('search_query', [''])[0]
+        self.server.requests += 1
+
+        entries = []
+        for doi in _DOI.findall(search_query):
+            identifier = arxiv_id(doi)
+            if identifier is not None:
+                entries.append(ENTRY.format(arxiv_id=identifier,
+                                            doi=escape(doi)))
+        # a single page contains all results
+        if start:
+            entries = []
+        body = FEED.format(count=len(entries), start=start,
+                           entries=''.join(entries)).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/atom+xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ArxivStub:
+    """Serve the stub in a background thread.
+
+    Use it as a context manager; `url` is the value for the config option
+    `complete.arxiv_url` and `requests` the number of requests served.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self._server = http.server.ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.requests = 0
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/api/query'
+
+    @property
+    def requests(self):
+        return self._server.requests
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=8765,
+                        help='port to listen on (default: 8765)')
+    args = parser.parse_args()
+
+    with ArxivStub(port=args.port) as stub:
+        print(f'serving at {stub.url}')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
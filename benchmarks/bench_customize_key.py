@@ -0,0 +1,132 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmark the generation of BibTeX keys.
+
+Compares `refmgr.bibtex.customize_key` with the implementation before the
+key templates were compiled, which filled all possible substitutions for
+every record.  Run it with `python benchmarks/bench_customize_key.py`.
+"""
+
+import argparse
+from collections import defaultdict
+import random
+import time
+
+from bibtexparser import customization as bibc
+
+from refmgr import bibtex, conf
+
+
+TEMPLATES = [
+    '{year}-{shortjournal_}-{author_max3}',
+    '{firstauthor}{year}',
+    '{author_max2_}-{title_max3}-{year}',
+]
+
+
+def legacy_customize_key(record, key):
+    """Return the key of `record` as computed before compiled templates."""
+    MAX_AUTHORS = 100
+    MAX_TITLE = 100
+
+    substitutions = defaultdict(lambda: '')
+    substitutions.update(record)
+
+    substitutions['original_key'] = record['ID']
+
+    if ('shortjournal' not in substitutions
+            and 'journal' in substitutions):
+        substitutions['shortjournal'] = substitutions['journal']
+    if ('shortjournal_' not in substitutions
+            and 'shortjournal' in substitutions):
+        substitutions['shortjournal_'] = (
+            substitutions['shortjournal'].replace('.', '')
+            )
+
+    authors = bibc.author(record.copy())['author']
+    lastnames = [''.join(s for s in name.split(',')[0].split())
+                 for name in authors]
+    firstauthor = lastnames[0]
+    all_authors = ' '.join(lastnames)
+    substitutions['firstauthor'] = firstauthor
+    substitutions['author'] = all_authors
+    for i in range(1, len(authors)):
+        substitutions[f'author_max{i}'] = firstauthor + 'et al'
+        substitutions[f'author_max{i}_'] = ' '.join(lastnames[:i]) + 'et al'
+    for i in range(len(authors), MAX_AUTHORS):
+        substitutions[f'author_max{i}'] = all_authors
+        substitutions[f'author_max{i}_'] = all_authors
+
+    title_words = record['title'].split()
+    for i in range(1, len(title_words)):
+        substitutions[f'title_max{i}'] = ' '.join(title_words[:i])
+    for i in range(len(title_words), MAX_TITLE):
+        substitutions[f'title_max{i}'] = ' '.join(title_words)
+
+    new_key = key.format_map(substitutions)
+    key_space = conf.get('bibtex', 'key_space', fallback='')
+    return key_space.join(new_key.split())
+
+
+def make_records(n, seed=0):
+    """Return `n` random article records."""
+    rng = random.Random(seed)
+    names = ['Fuchs', 'Smith', 'von Neumann', 'Müller', 'Doe', 'Nguyen',
+             'Einstein', 'Curie', 'Noether', 'Dirac']
+    words = ['quantum', 'error', 'correction', 'lattice', 'gauge', 'theory',
+             'on', 'the', 'of', 'a', 'dynamics', 'entanglement']
+    journals = ['Phys. Rev. Lett.', 'Nature', 'J. Math. Phys.', 'Ann. Phys.']
+    records = []
+    for i in range(n):
+        authors = ' and '.join(f'{rng.choice(names)}, A.'
+                               for _ in range(rng.randint(1, 30)))
+        title = ' '.join(rng.choice(words) for _ in range(rng.randint(3, 20)))
+        records.append({'ENTRYTYPE': 'article', 'ID': f'key{i}',
+                        'author': authors, 'title': title,
+                        'journal': rng.choice(journals),
+                        'year': str(rng.randint(1900, 2021))})
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', type=int, default=20000,
+                        help='number of records (default: 20000)')
+    args = parser.parse_args()
+
+    records = make_records(args.n)
+    for template in TEMPLATES:
+        conf['bibtex']['article_key'] = template
+        bibtex.KeyTemplates.load()
+
+        start = time.perf_counter()
+        before = [legacy_customize_key(record, template)
+                  for record in records]
+        legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        after = [bibtex.customize_key(dict(record))['ID']
+                 for record in records]
+        compiled = time.perf_counter() - start
+
+        assert before == after, 'keys differ'
+        print(f'{template:40} before: {1e6 * legacy / args.n:7.1f} us/record'
+              f'  after: {1e6 * compiled / args.n:7.1f} us/record')
+
+
+if __name__ == '__main__':
+    main()
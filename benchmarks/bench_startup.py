@@ -0,0 +1,112 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Check the startup time of trivial refmgr commands.
+
+Every command runs in a fresh interpreter, which measures the time of
+importing `refmgr.ui` and running `main` and records the slow modules it
+imported.  The script exits with status 1 if a command exceeds the time
+budget or imports one of the slow modules.  Run it with
+`python benchmarks/bench_startup.py`.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+COMMANDS = [
+    ['--version'],
+    ['config'],
+    ['config', '--help'],
+]
+
+#: Modules which must not be imported by the trivial commands.
+SLOW_MODULES = ['bibtexparser', 'pyparsing', 'arxiv', 'requests',
+                'pkg_resources', 'refmgr.references']
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+from refmgr.ui import main
+sys.argv = ['refmgr'] + {argv!r}
+try:
+    main()
+except SystemExit:
+    pass
+elapsed = time.perf_counter() - start
+print(json.dumps({{'time': elapsed,
+                   'slow': [m for m in {slow!r} if m in sys.modules]}}),
+      file=sys.stderr)
+'''
+
+
+def measure(argv, repeat):
+    """Return the best time of `repeat` runs of `refmgr argv` and the slow
+    modules it imported."""
+    env = dict(os.environ)
+    src = os.path.join(os.path.dirname(__file__), os.pardir, 'src')
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [os.path.abspath(src), env.get('PYTHONPATH')]))
+    # don't read the config of the user
+    argv = ['-c', os.devnull] + argv
+
+    results = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, '-c', CHILD.format(argv=argv, slow=SLOW_MODULES)],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            text=True, check=True)
+        results.append(json.loads(proc.stderr.strip().splitlines()[-1]))
+    best = min(result['time'] for result in results)
+    return best, results[0]['slow']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--budget', type=float, default=0.05,
+                        help='time budget per command in seconds '
+                        '(default: 0.05)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of runs per command (default: 5)')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args()
+
+    failed = False
+    results = {}
+    for argv in COMMANDS:
+        elapsed, slow = measure(argv, args.repeat)
+        ok = elapsed <= args.budget and not slow
+        failed = failed or not ok
+        results[' '.join(argv)] = {'time': elapsed, 'slow_modules': slow,
+                                   'ok': ok}
+        if not args.json:
+            status = 'ok' if ok else 'FAILED'
+            print(f"refmgr {' '.join(argv):20} {1000 * elapsed:6.1f} ms  "
+                  f"{status}{'  imports ' + ', '.join(slow) if slow else ''}")
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
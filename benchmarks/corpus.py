@@ -0,0 +1,223 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Generate synthetic BibTeX corpora for benchmarks.
+
+The corpora are deterministic for a given seed.  They contain entries with
+up to 60 authors, long titles with math and protected words, @string
+definitions, LaTeX accents, months given as macros, DOIs and eprints, and
+journals which are known (with full or abbreviated names), given by a
+@string or unknown.  Run `python benchmarks/corpus.py --help` for the
+command line interface.
+"""
+
+import argparse
+import os
+import random
+
+
+LAST_NAMES = [
+    'Fuchs', 'Smith', 'von Neumann', 'M{\\"u}ller', 'Müller', 'Doe',
+    'Nguyen', 'Einstein', 'Curie', 'Noether', 'Dirac', 'Schr{\\"o}dinger',
+    'Erd{\\H{o}}s', 'G{\\\'o}mez', 'de la Cruz', 'O\'Neil', 'Ng',
+    'Garc{\\\'\\i}a', 'Ma{\\~n}ana', '{\\AA}ngstr{\\"o}m', 'Wei{\\ss}',
+    'Brand{\\~a}o', 'Zurek', 'Preskill', 'Shor', 'Kitaev', 'Gottesman',
+]
+FIRST_NAMES = [
+    'Jacob', 'A.', 'John', 'J{\\"o}rg', 'Fran{\\c{c}}ois', 'Ana', 'Li',
+    'M.~K.', 'Peter W.', 'Daniel', 'Ren{\\\'e}e', 'Hans-Peter',
+]
+WORDS = [
+    'quantum', 'error', 'correction', 'lattice', 'gauge', 'theory', 'on',
+    'the', 'of', 'a', 'dynamics', 'entanglement', 'topological', 'codes',
+    'fault-tolerant', 'computation', 'with', 'in', 'thermalization',
+    'many-body', 'localization', 'random', 'circuits', 'benchmarks',
+    '$\\alpha$-stable', '$SU(2)$', '{DNA}', '{B}ose-{E}instein',
+    'condensates', 'na{\\"\\i}ve', 'r{\\\'e}sum{\\\'e}', 'Schr{\\"o}dinger',
+]
+TOPICS = [
+    'Physics', 'Mathematics', 'Chemistry', 'Biology', 'Computing',
+    'Optics', 'Statistics', 'Materials', 'Information', 'Geometry',
+    'Algebra', 'Topology', 'Mechanics', 'Acoustics', 'Photonics',
+]
+QUALIFIERS = [
+    'Applied', 'Theoretical', 'Computational', 'Experimental', 'Modern',
+    'Quantum', 'Mathematical', 'Statistical', 'Nonlinear', 'Soft',
+]
+MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep',
+          'oct', 'nov', 'dec']
+
+
+def make_journals(n, seed=0):
+    """Return a list of `n` tuples `(journal, abbreviation)`."""
+    rng = random.Random(seed)
+    journals = {}
+    while len(journals) < n:
+        topic = rng.choice(TOPICS)
+        qualifier = rng.choice(QUALIFIERS)
+        series = rng.choice(['', ' A', ' B', ' Letters', ' Reviews'])
+        number = len(journals)
+        journal = f'Journal of {qualifier} {topic}{series} {number}'
+        abbreviation = f'J. {qualifier[:4]}. {topic[:4]}.{series} {number}'
+        journals[journal] = abbreviation
+    return list(journals.items())
+
+
+def write_journals_csv(path, journals):
+    """Write the journal abbreviations `journals` to a CSV file at `path` in
+    the format of refmgr."""
+    with open(path, 'w') as file:
+        for journal, abbreviation in journals:
+            file.write(f'{journal};{abbreviation}\n')
+
+
+def _author(rng):
+    """Return a random author name in one of the BibTeX name formats."""
+    last = rng.choice(LAST_NAMES)
+    first = rng.choice(FIRST_NAMES)
+    if ' ' in last and rng.random() < 0.5:
+        return f'{first} {last}'
+    return f'{last}, {first}'
+
+
+def _title(rng):
+    """Return a random title."""
+    words = [rng.choice(WORDS) for _ in range(rng.randint(5, 40))]
+    words[0] = words[0].capitalize()
+    return ' '.join(words)
+
+
+def make_entry(i, rng, journals, macros):
+    """Return the BibTeX source of the `i`-th entry.
+
+    `journals` is a list of known journals as returned by `make_journals`
+    and `macros` a list of tuples `(macro, journal)` defined by @string.
+    """
+    n_authors = rng.choice([1, 1, 2, 3, 4, 5, 8, 12, rng.randint(20, 60)])
+    fields = {
+        'author': ' and '.join(_author(rng) for _ in range(n_authors)),
+        'title': _title(rng),
+        'year': str(rng.randint(1900, 2023)),
+        }
+
+    entrytype = rng.choices(['article', 'inproceedings', 'book', 'misc'],
+                            weights=[80, 10, 5, 5])[0]
+    journal = None
+    if entrytype == 'article':
+        kind = rng.random()
+        if kind < 0.4:
+            journal = '{' + rng.choice(journals)[0] + '}'
+        elif kind < 0.6:
+            journal = '{' + rng.choice(journals)[1] + '}'
+        elif kind < 0.8:
+            journal = rng.choice(macros)[0]
+        else:
+            journal = '{' + f'Unknown Bulletin of {rng.choice(TOPICS)}' + '}'
+        fields['volume'] = str(rng.randint(1, 150))
+        first_page = rng.randint(1, 5000)
+        fields['pages'] = f'{first_page}--{first_page + rng.randint(1, 40)}'
+    elif entrytype == 'inproceedings':
+        fields['booktitle'] = f'Proceedings of the {_title(rng)}'
+    elif entrytype == 'book':
+        fields['publisher'] = f'{rng.choice(LAST_NAMES)} Press'
+
+    if rng.random() < 0.8:
+        fields['doi'] = rng.choice(['', 'https://doi.org/', 'doi:']) + (
+            f'10.{rng.randint(1000, 9999)}/bench.{i}')
+    if rng.random() < 0.3:
+        fields['eprint'] = f'{rng.randint(1000, 2300)}.{i % 100000:05d}'
+        fields['archiveprefix'] = 'arXiv'
+    if rng.random() < 0.2:
+        fields['abstract'] = ' '.join(_title(rng) for _ in range(5))
+    if rng.random() < 0.1:
+        fields['note'] = ''
+
+    lines = [f'@{entrytype}{{bench{i},']
+    for field, value in fields.items():
+        lines.append(f'  {field} = {{{value}}},')
+    if journal is not None:
+        lines.append(f'  journal = {journal},')
+    if rng.random() < 0.7:
+        lines.append(f'  month = {rng.choice(MONTHS)},')
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def make_corpus(n, journals, seed=0, start=0):
+    """Return the BibTeX source of a corpus with `n` entries numbered from
+    `start`.
+
+    The corpus starts with @string definitions of some of the `journals`.
+    """
+    rng = random.Random(seed * 1000003 + start)
+    macros = [(f'jour{k}', journal)
+              for k, (journal, _) in enumerate(rng.sample(
+                  journals, min(10, len(journals))))]
+    parts = [f'@string{{{macro} = "{journal}"}}\n' for macro, journal in macros]
+    parts.append('\n')
+    parts.extend(make_entry(start + i, rng, journals, macros) + '\n'
+                 for i in range(n))
+    return ''.join(parts)
+
+
+def write_corpus(path, n, journals, seed=0):
+    """Write a corpus with `n` entries to a single file at `path`."""
+    with open(path, 'w') as file:
+        file.write(make_corpus(n, journals, seed))
+
+
+def write_corpus_files(dirname, n, per_file, journals, seed=0):
+    """Write a corpus with `n` entries to files with `per_file` entries in
+    the directory `dirname` and return the list of paths."""
+    os.makedirs(dirname, exist_ok=True)
+    paths = []
+    for start in range(0, n, per_file):
+        path = os.path.join(dirname, f'bench{start:07d}.bib')
+        with open(path, 'w') as file:
+            file.write(make_corpus(min(per_file, n - start), journals, seed,
+                                   start))
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', type=int, default=1000,
+                        help='number of entries (default: 1000)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed (default: 0)')
+    parser.add_argument('--per-file', type=int,
+                        help='write files with this number of entries to '
+                        'the directory OUTPUT instead of a single file')
+    parser.add_argument('--journals', type=int, default=2000,
+                        help='number of known journals (default: 2000)')
+    parser.add_argument('--journals-csv',
+                        help='write the known journals to this CSV file')
+    parser.add_argument('output', help='output file or directory')
+    args = parser.parse_args()
+
+    journals = make_journals(args.journals, args.seed)
+    if args.journals_csv:
+        write_journals_csv(args.journals_csv, journals)
+    if args.per_file:
+        write_corpus_files(args.output, args.n, args.per_file, journals,
+                           args.seed)
+    else:
+        write_corpus(args.output, args.n, journals, args.seed)
+
+
+if __name__ == '__main__':
+    main()
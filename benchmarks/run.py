@@ -0,0 +1,297 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmark the hot paths of refmgr on synthetic corpora.
+
+For every corpus size, a corpus is generated with `corpus.py` and the
+following are timed: parsing with and without customizations, every step
+of the customization pipeline, `Journals.from_record`, writing with
+`init_writer().write` and importing with `import_bib` into an empty library,
+both as multiple files and as single files with arXiv completion.  arXiv is
+replaced by the local stub of `arxiv_stub.py`, so nothing is fetched from
+the network.  The memory kept by the parsed entries is measured both for
+plain dicts and for `refmgr.entry.Entry`.
+
+The results can be written as JSON with `--output` and compared to the
+results of another commit with `--compare`, which exits with status 1 if
+a benchmark got slower by more than `--threshold`.  Run it with
+`PYTHONPATH=src python benchmarks/run.py`.
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+from bibtexparser.bibdatabase import BibDatabase
+
+from refmgr import bibtex, conf, references
+
+import arxiv_stub
+import corpus
+
+
+def config(tmpdir, arxiv_url):
+    """Return the config used by the benchmarks."""
+    return {
+        'library': {'path': os.path.join(tmpdir, 'library'),
+                    'fsync': 'none'},
+        'bibtex': {'convert_month': 'True',
+                   'abbreviate_journals': 'True',
+                   'normalize_doi': 'True',
+                   'remove_empty_fields': 'True',
+                   'convert_to_unicode': 'True',
+                   'article_key': '{firstauthor}{year}-{title_max3}',
+                   'key_space': '_'},
+        'complete': {'arxiv_url': arxiv_url,
+                     'arxiv_delay': '0'},
+        'cache': {'enabled': 'False'},
+        }
+
+
+def timed(function, repeat, setup=None):
+    """Call `function` `repeat` times and return the list of durations.
+
+    If `setup` is given, it is called before every call of `function` and
+    its result is passed to `function`; it is not timed.
+    """
+    durations = []
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        function(*args)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+class Runner:
+    """Run benchmarks and collect their results."""
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def run(self, name, size, items, function, setup=None):
+        """Time `function` (see `timed`) processing `items` items of the
+        corpus with `size` entries and record the result."""
+        durations = timed(function, self.repeat, setup)
+        result = {'name': name, 'size': size, 'items': items,
+                  'best': min(durations),
+                  'median': statistics.median(durations)}
+        result['per_item_us'] = 1e6 * result['best'] / max(items, 1)
+        self.results.append(result)
+        print(f"{name:40} {size:>7} {1000 * result['best']:10.1f} ms "
+              f"{result['per_item_us']:10.1f} us/item", file=sys.stderr)
+        return result
+
+    def memory(self, name, size, items, function):
+        """Measure the memory kept alive by the result of `function`,
+        which contains `items` items of the corpus with `size` entries, and
+        record the result."""
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            kept = function()
+            # free the garbage cycles of the parser
+            gc.collect()
+            used, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del kept
+
+        result = {'name': name, 'size': size, 'items': items,
+                  'bytes': used - before,
+                  'bytes_per_item': (used - before) / max(items, 1)}
+        self.results.append(result)
+        print(f"{name:40} {size:>7} {result['bytes'] / 2**20:10.1f} MiB "
+              f"{result['bytes_per_item']:10.0f} B/item", file=sys.stderr)
+        return result
+
+
+def parse(path, customize=True, compact=True):
+    """Parse the file at `path` and return the BibDatabase.
+
+    If `compact` is `False`, the entries are kept as dicts.
+    """
+    bparser = bibtex.init_parser()
+    if not customize:
+        bparser.customization = None
+    elif not compact:
+        steps = bparser.customization.steps
+        bparser.customization = bibtex.Customizations(
+            step for step in steps if step[0] != 'compact')
+    with open(path) as file:
+        return bparser.parse_file(file)
+
+
+def bench_corpus(runner, tmpdir, size, journals, seed):
+    """Run all benchmarks on a corpus with `size` entries."""
+    path = os.path.join(tmpdir, f'corpus{size}.bib')
+    corpus.write_corpus(path, size, journals, seed)
+
+    runner.run('parse_file', size, size, lambda: parse(path))
+    runner.run('parse_file[no customizations]', size, size,
+               lambda: parse(path, customize=False))
+    runner.memory('memory.entries[dict]', size, size,
+                  lambda: parse(path, compact=False).entries)
+    runner.memory('memory.entries[Entry]', size, size,
+                  lambda: parse(path).entries)
+
+    # time every step on the records customized by the previous steps
+    records = parse(path, customize=False).entries
+    for name, function in bibtex.Customizations.from_config().steps:
+        if name == 'compact':
+            continue
+        if name == 'abbreviate_journals':
+            runner.run('Journals.from_record', size, len(records),
+                       lambda inputs: [bibtex.Journals.from_record(record)
+                                       for record in inputs],
+                       lambda: records)
+        runner.run(f'customize.{name}', size, len(records),
+                   lambda inputs: [function(record) for record in inputs],
+                   lambda: [dict(record) for record in records])
+        records = [function(dict(record)) for record in records]
+
+    db = BibDatabase()
+    db.entries = records
+    runner.run('init_writer().write', size, len(records),
+               lambda: bibtex.init_writer().write(db))
+
+    libraries = iter(range(sys.maxsize))
+
+    def new_library():
+        library = os.path.join(tmpdir, f'library{size}-{next(libraries)}')
+        os.makedirs(library)
+        conf['library']['path'] = library
+
+    per_file = 10
+    dirname = os.path.join(tmpdir, f'files{size}')
+    paths = corpus.write_corpus_files(dirname, size, per_file, journals, seed)
+    runner.run('import_bib[multi]', size, size,
+               lambda _: [references.import_bib(p, completions=['arxiv'])
+                          for p in paths],
+               new_library)
+    runner.run('import_bib[single]', size, size,
+               lambda _: references.import_bib(path, single=True,
+                                               completions=['arxiv']),
+               new_library)
+
+
+def git_commit():
+    """Return the current commit of the repository or `None`."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print the ratios of `results` and `baseline` and return whether a
+    benchmark is slower than `threshold` times the baseline."""
+    old = {(result['name'], result['size']): result
+           for result in baseline['results']}
+    regression = False
+    for result in results:
+        key = result['name'], result['size']
+        if key not in old:
+            continue
+        # time or memory
+        metric = 'best' if 'best' in result else 'bytes'
+        ratio = result[metric] / old[key][metric]
+        slower = ratio > threshold
+        regression = regression or slower
+        print(f"{result['name']:40} {result['size']:>7} {ratio:6.2f}x"
+              f"{'  SLOWER' if slower else ''}")
+    return regression
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000],
+                        help='numbers of entries of the corpora '
+                        '(default: 1000)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs per benchmark (default: 3)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed of the corpora (default: 0)')
+    parser.add_argument('--journals', type=int, default=2000,
+                        help='number of known journals (default: 2000)')
+    parser.add_argument('-o', '--output',
+                        help='write the results as JSON to this file')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='compare with the results in this file')
+    parser.add_argument('--threshold', type=float, default=1.1,
+                        help='ratio of times considered a regression '
+                        '(default: 1.1)')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+
+    with tempfile.TemporaryDirectory() as tmpdir, \
+            arxiv_stub.ArxivStub() as stub:
+        conf.read_dict(config(tmpdir, stub.url))
+
+        journals = corpus.make_journals(args.journals, args.seed)
+        csv_path = os.path.join(tmpdir, 'journal_abbreviations.csv')
+        corpus.write_journals_csv(csv_path, journals)
+        bibtex.Journals.csv_path = staticmethod(lambda: csv_path)
+        bibtex.Journals.ensure_loaded()
+
+        runner = Runner(args.repeat)
+        for size in args.sizes:
+            bench_corpus(runner, tmpdir, size, journals, args.seed)
+        requests = stub.requests
+
+    output = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'sizes': args.sizes,
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'arxiv_requests': requests,
+            },
+        'results': runner.results,
+        }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(output, file, indent=2)
+            file.write('\n')
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(runner.results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
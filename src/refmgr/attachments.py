@@ -0,0 +1,226 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Copy the attachments of imported BibTeX files into the library."""
+
+from concurrent.futures import ThreadPoolExecutor
+import enum
+import errno
+import logging
+import os
+import shutil
+import threading
+import warnings
+
+from . import conf
+from . import stats
+
+
+class CopyMode(enum.Enum):
+    """Possible ways to transfer attachments into the library."""
+    #: Copy the data, in the kernel where possible.
+    COPY = enum.auto()
+    #: Clone the file sharing its data (copy-on-write) if the file system
+    #: supports it and copy it otherwise.
+    REFLINK = enum.auto()
+    #: Hard link the file if possible and copy it otherwise.
+    HARDLINK = enum.auto()
+    #: Move the file.
+    MOVE = enum.auto()
+
+
+# ioctl request cloning a file on Linux (btrfs, XFS, ...)
+_FICLONE = 0x40049409
+
+# errors of clones, links and copy_file_range meaning the operation isn't
+# supported for the files
+_UNSUPPORTED = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.ENOTTY,
+                errno.EOPNOTSUPP, errno.EPERM, errno.EMLINK, errno.EBADF}
+
+
+def _clone(src, dst):
+    """Clone `src` to `dst` sharing the data.
+
+    Raises an `OSError` if the file system doesn't support clones.
+    """
+    import fcntl
+
+    with open(src, 'rb') as infile, open(dst, 'wb') as outfile:
+        try:
+            fcntl.ioctl(outfile.fileno(), _FICLONE, infile.fileno())
+        except OSError:
+            outfile.close()
+            os.unlink(dst)
+            raise
+
+
+def _copy(src, dst):
+    """Copy `src` to `dst` with `os.copy_file_range`, which lets the
+    kernel (or a network file system) copy the data without passing it
+    through the process, and with `shutil.copyfile` if that's not
+    possible."""
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    if copy_file_range is None:
+        shutil.copyfile(src, dst)
+        return
+
+    with open(src, 'rb') as infile, open(dst, 'wb') as outfile:
+        size = os.fstat(infile.fileno()).st_size
+        offset = 0
+        try:
+            while offset < size:
+                copied = copy_file_range(infile.fileno(), outfile.fileno(),
+                                         size - offset)
+                if copied == 0:
+                    break
+                offset += copied
+            return
+        except OSError as exc:
+            if exc.errno not in _UNSUPPORTED or offset:
+                raise
+    shutil.copyfile(src, dst)
+
+
+def _link(src, dst):
+    """Hard link `src` to `dst` replacing `dst`."""
+    tmp = f'{dst}.{os.getpid()}.{threading.get_ident()}.tmp'
+    os.link(src, tmp)
+    try:
+        os.replace(tmp, dst)
+    except OSError:
+        os.unlink(tmp)
+        raise
+
+
+def transfer(src, dst, mode=CopyMode.COPY):
+    """Transfer the file `src` to `dst` according to the `CopyMode` `mode`.
+
+    An existing file `dst` is replaced.  Clones and hard links fall back to
+    copying if the file system doesn't support them.
+    """
+    if mode is CopyMode.MOVE:
+        shutil.move(src, dst)
+        return
+    if mode is not CopyMode.COPY:
+        try:
+            if mode is CopyMode.REFLINK:
+                _clone(src, dst)
+            else:
+                _link(src, dst)
+            return
+        except OSError as exc:
+            if exc.errno not in _UNSUPPORTED:
+                raise
+            logging.debug('copying %s: %s not possible: %s', src,
+                          mode.name.lower(), exc)
+    _copy(src, dst)
+
+
+def _attachment_name(name, ext):
+    """Return the file name `name` with its extension substituted by
+    `ext`."""
+    root, _ = os.path.splitext(name)
+    return f"{root}.{ext.rstrip('.')}"
+
+
+class AttachmentCopier:
+    """Copy the attachments of BibTeX files, e.g. PDFs, by a pool of
+    `workers` threads.
+
+    The attachments of a BibTeX file are the files with the same name but
+    another extension.  Every source directory is listed once, so missing
+    attachments cost no system calls.  `mode` is the `CopyMode` of the
+    copies.  At most `2 * workers` copies are pending; `copy` blocks
+    otherwise.  Errors are reported as warnings by `close`.
+    """
+
+    def __init__(self, mode=CopyMode.COPY, workers=4):
+        self.mode = mode
+        workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(2 * workers)
+        self._listings = {}
+        self._futures = []
+
+    @classmethod
+    def from_config(cls, mode=None):
+        """Return a copier configured by the config section `import`.
+
+        `mode` is the name of the `CopyMode` overriding the config option
+        `import.copy_mode`.
+        """
+        if mode is None:
+            mode = conf.get('import', 'copy_mode', fallback='copy')
+        return cls(CopyMode[mode.upper()],
+                   workers=conf.getint('import', 'copy_workers', fallback=4))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _listing(self, dirname):
+        """Return the set of names of the files in the directory
+        `dirname`."""
+        if dirname not in self._listings:
+            try:
+                with os.scandir(dirname) as it:
+                    self._listings[dirname] = {dir_entry.name
+                                               for dir_entry in it}
+            except FileNotFoundError:
+                self._listings[dirname] = set()
+        return self._listings[dirname]
+
+    def copy(self, path, outpath, extensions):
+        """Queue copying the attachments of the file `path` with the given
+        `extensions` next to the file `outpath`."""
+        dirname, name = os.path.split(path)
+        outdir, outname = os.path.split(outpath)
+        listing = self._listing(dirname or os.curdir)
+        for ext in extensions:
+            src_name = _attachment_name(name, ext)
+            if src_name not in listing:
+                continue
+            src = os.path.join(dirname, src_name)
+            dst = os.path.join(outdir, _attachment_name(outname, ext))
+            logging.info('copying %s to %s', src, dst)
+            self._slots.acquire()
+            future = self._executor.submit(self._transfer, src, dst)
+            future.add_done_callback(lambda _: self._slots.release())
+            self._futures.append((src, dst, future))
+
+    def _transfer(self, src, dst):
+        with stats.timer('copy'):
+            transfer(src, dst, self.mode)
+        stats.count('copy.files')
+
+    def wait(self):
+        """Wait for the queued copies and report their errors as
+        warnings."""
+        futures, self._futures = self._futures, []
+        for src, dst, future in futures:
+            exc = future.exception()
+            if exc is not None:
+                msg = f'copying {src} to {dst} failed: {exc}'
+                warnings.warn(msg, RuntimeWarning)
+
+    def close(self):
+        """Wait for the queued copies and stop the threads."""
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown()
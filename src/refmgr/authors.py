@@ -0,0 +1,94 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Parse the author fields of BibTeX entries.
+
+The same author lists appear in many entries, so the parsed author fields
+are cached by their value.
+"""
+
+from collections import namedtuple
+import functools
+import re
+import unicodedata
+
+from . import latex
+
+#: Maximal number of author fields kept in the caches.
+CACHE_SIZE = 16384
+
+#: A parsed name; every part is a string of space separated words.
+Name = namedtuple('Name', ['last', 'first', 'von', 'jr'])
+
+# case-insensitive like bibtexparser.customization.author
+_AND = re.compile(r'\ and\ ', flags=re.IGNORECASE)
+_NON_WORD = re.compile(r'[\W_]+')
+# letters without decomposition into a base letter and accents
+_BASE_LETTERS = str.maketrans({'ı': 'i', 'ȷ': 'j', 'ø': 'o', 'Ø': 'O',
+                               'ł': 'l', 'Ł': 'L', 'đ': 'd', 'Đ': 'D',
+                               'æ': 'ae', 'Æ': 'AE', 'œ': 'oe', 'Œ': 'OE'})
+
+
+def split_names(authors):
+    """Return the list of names in the author field `authors` like
+    `bibtexparser.customization.author`.
+
+    As there, the names are separated by `and` in any case, e.g., `AND`,
+    surrounded by single spaces.
+    """
+    return [name.strip() for name in _AND.split(authors.replace('\n', ' '))]
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse_names(authors):
+    """Return the tuple of `Name`s in the author field `authors`.
+
+    Malformed names are parsed as well as possible; empty names are
+    skipped.
+    """
+    from bibtexparser.customization import splitname
+
+    names = []
+    for name in split_names(authors):
+        parts = splitname(name, strict_mode=False)
+        if parts:
+            names.append(Name(*(' '.join(parts[field])
+                                for field in Name._fields)))
+    return tuple(names)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def key_last_names(authors):
+    """Return the tuple of last names in the author field `authors` as
+    used in BibTeX keys.
+
+    The names are split like by `bibtexparser.customization.author` and
+    the whitespace in the last names is removed, so generated keys don't
+    depend on the cache.
+    """
+    from bibtexparser.customization import getnames
+
+    return tuple(''.join(name.split(',')[0].split())
+                 for name in getnames(split_names(authors)))
+
+
+def normalize(name):
+    """Return `name` converted to unicode without accents, punctuation and
+    whitespace in lower case for comparing names."""
+    name = unicodedata.normalize('NFKD', latex.to_unicode(name))
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    return _NON_WORD.sub('', name.translate(_BASE_LETTERS)).casefold()
+
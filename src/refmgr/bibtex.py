@@ -17,27 +17,133 @@
 """Handling bibtex files."""
 
 from collections import defaultdict
+from collections.abc import Mapping
+import importlib
+import importlib.resources
 import logging
 import csv
+import mmap
+import os.path
+import re
+import string
+import struct
 
-from bibtexparser.bparser import BibTexParser
-from bibtexparser.bwriter import BibTexWriter
-from bibtexparser import customization as bibc
-import pkg_resources
-
+from . import authors
 from . import conf
+from . import entry
+from . import latex
+from . import stats
+
+# bibtexparser is imported by the functions using it because importing it
+# is slow and not needed, e.g., for showing the config.
+
+
+class MappedTable(Mapping):
+    """A read-only mapping of strings to strings stored in a buffer, e.g.,
+    a memory-mapped file.
+
+    The table consists of `count` index records starting at `offset`, each
+    record holding the offsets and lengths of a key and its value in the
+    buffer.  The records are sorted by the UTF-8 encoded keys, so a lookup
+    is a binary search in the buffer and nothing has to be loaded up front.
+    If `memoize` is true, results of lookups are remembered, which pays off
+    for keys repeating a lot like journal names; the memo grows with the
+    number of distinct keys looked up.
+    """
+
+    RECORD = struct.Struct('<IIII')
+
+    def __init__(self, buffer, offset, count, memoize=True):
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+        self._lookups = {} if memoize else None
+
+    def _record(self, i):
+        return self.RECORD.unpack_from(self._buffer,
+                                       self._offset + i * self.RECORD.size)
+
+    def _key(self, i):
+        key_offset, key_len, _, _ = self._record(i)
+        return self._buffer[key_offset:key_offset + key_len]
+
+    def __getitem__(self, key):
+        if self._lookups is None:
+            value = self._lookup(key)
+        else:
+            try:
+                value = self._lookups[key]
+            except KeyError:
+                value = self._lookups[key] = self._lookup(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def _lookup(self, key):
+        """Return the value of `key` or `None` if `key` is unknown."""
+        encoded = key.encode('utf-8')
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < encoded:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count:
+            key_offset, key_len, value_offset, value_len = self._record(lo)
+            if self._buffer[key_offset:key_offset + key_len] == encoded:
+                value = self._buffer[value_offset:value_offset + value_len]
+                return value.decode('utf-8')
+        return None
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._key(i).decode('utf-8')
+
+    def __len__(self):
+        return self._count
 
 
 class Journals:
     to_abbreviation = {}
     from_abbreviation = {}
 
-    @classmethod
-    def load_data(cls):
-        """Load the journal abbreviations."""
-        logging.debug('loading journal abbreviations')
-        path = pkg_resources.resource_filename(
-            __name__, 'data/journal_abbreviations.csv')
+    #: Header of the compiled journal abbreviations: magic bytes, version,
+    #: size and mtime of the CSV file and the number of entries of the
+    #: tables `to_abbreviation` and `from_abbreviation`.
+    COMPILED_HEADER = struct.Struct('<4sIQqII')
+    COMPILED_MAGIC = b'RMJA'
+    #: Version of the layout of the compiled journal abbreviations.  Compiled
+    #: files with another version are ignored and rebuilt.
+    COMPILED_VERSION = 1
+
+    @staticmethod
+    def csv_path():
+        """Return the path of the CSV file with the journal
+        abbreviations."""
+        return str(importlib.resources.files(__package__)
+                   / 'data' / 'journal_abbreviations.csv')
+
+    @staticmethod
+    def compiled_path(csv_path):
+        """Return the path of the compiled journal abbreviations of the CSV
+        file at `csv_path`."""
+        root, _ = os.path.splitext(csv_path)
+        return root + '.bin'
+
+    @staticmethod
+    def _stamp(path):
+        """Return a tuple identifying the content of the file at `path`."""
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def read_csv(path):
+        """Read the journal abbreviations from the CSV file at `path`.
+
+        Returns a tuple of dicts `(to_abbreviation, from_abbreviation)`.
+        """
+        logging.debug('reading journal abbreviations from %s', path)
         with open(path, 'rt') as file:
             data = csv.reader(file, delimiter=';', quoting=csv.QUOTE_NONE)
 
@@ -53,17 +159,121 @@ class Journals:
                 to_abbreviation[journal] = shortjournal
                 from_abbreviation[shortjournal] = journal
 
-        cls.to_abbreviation = to_abbreviation
-        cls.from_abbreviation = from_abbreviation
+        return to_abbreviation, from_abbreviation
 
     @classmethod
-    def from_record(cls, record):
-        """Return the journal name and it's abbreviation of the BibTeX entry
-        `record`.
+    def build(cls, csv_path=None, compiled_path=None, data=None):
+        """Compile the journal abbreviations of the CSV file at `csv_path`
+        into a binary file at `compiled_path` and return its path.
+
+        The defaults are `csv_path()` and `compiled_path(csv_path)`,
+        respectively.  If `data` is given, it is used instead of reading the
+        CSV file again (see `read_csv`).  The binary file consists of a
+        header (`COMPILED_HEADER`), the index records of the two
+        `MappedTable`s and the UTF-8 encoded strings.
+        """
+        if csv_path is None:
+            csv_path = cls.csv_path()
+        if compiled_path is None:
+            compiled_path = cls.compiled_path(csv_path)
+        stamp = cls._stamp(csv_path)
+        if data is None:
+            data = cls.read_csv(csv_path)
+
+        tables = [sorted((key.encode('utf-8'), value.encode('utf-8'))
+                         for key, value in mapping.items())
+                  for mapping in data]
+        record_size = MappedTable.RECORD.size
+        heap_offset = (cls.COMPILED_HEADER.size
+                       + record_size * sum(len(table) for table in tables))
+
+        heap = bytearray()
+        strings = {}
+
+        def add_string(string):
+            if string not in strings:
+                strings[string] = heap_offset + len(heap)
+                heap.extend(string)
+            return strings[string], len(string)
+
+        records = bytearray()
+        for table in tables:
+            for key, value in table:
+                records.extend(MappedTable.RECORD.pack(*add_string(key),
+                                                       *add_string(value)))
+
+        logging.debug('writing compiled journal abbreviations to %s',
+                      compiled_path)
+        tmp_path = f'{compiled_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(cls.COMPILED_HEADER.pack(
+                cls.COMPILED_MAGIC, cls.COMPILED_VERSION, *stamp,
+                *(len(table) for table in tables)))
+            file.write(records)
+            file.write(heap)
+        os.replace(tmp_path, compiled_path)
+
+        return compiled_path
 
-        Returns a tuple `(journal, journal_abbreviation)`.  If the journal is
-        not known, `(None, None)` is returned.
+    @classmethod
+    def _load_compiled(cls, csv_path, compiled_path):
+        """Return the tables `(to_abbreviation, from_abbreviation)` of the
+        compiled journal abbreviations at `compiled_path` or `None` if they
+        are missing or outdated.
+
+        The file is memory-mapped, so it is shared between processes and
+        nothing is read before the first lookup.
         """
+        try:
+            with open(compiled_path, 'rb') as file:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            magic, version, size, mtime, n_to, n_from = (
+                cls.COMPILED_HEADER.unpack_from(buffer))
+        except struct.error:
+            return None
+        if magic != cls.COMPILED_MAGIC or version != cls.COMPILED_VERSION:
+            return None
+        try:
+            if (size, mtime) != cls._stamp(csv_path):
+                return None
+        except FileNotFoundError:
+            # only the compiled file is available
+            pass
+
+        offset = cls.COMPILED_HEADER.size
+        to_abbreviation = MappedTable(buffer, offset, n_to)
+        offset += n_to * MappedTable.RECORD.size
+        from_abbreviation = MappedTable(buffer, offset, n_from)
+        return to_abbreviation, from_abbreviation
+
+    @classmethod
+    def load_data(cls):
+        """Load the journal abbreviations.
+
+        The compiled journal abbreviations are used if they are up to date.
+        Otherwise the CSV file is read and compiled again if possible.
+        """
+        logging.debug('loading journal abbreviations')
+        csv_path = cls.csv_path()
+        compiled_path = cls.compiled_path(csv_path)
+
+        tables = cls._load_compiled(csv_path, compiled_path)
+        if tables is None:
+            tables = cls.read_csv(csv_path)
+            try:
+                cls.build(csv_path, compiled_path, tables)
+            except OSError as exc:
+                logging.debug('cannot compile journal abbreviations: %s', exc)
+
+        cls.to_abbreviation, cls.from_abbreviation = tables
+
+    @classmethod
+    def ensure_loaded(cls):
+        """Load the journal abbreviations unless they are loaded."""
         if not (cls.to_abbreviation and cls.from_abbreviation):
             logging.debug('len(%s.to_abbreviation) = %s',
                           cls, len(cls.to_abbreviation))
@@ -71,6 +281,16 @@ class Journals:
                           cls, len(cls.from_abbreviation))
             cls.load_data()
 
+    @classmethod
+    def from_record(cls, record):
+        """Return the journal name and it's abbreviation of the BibTeX entry
+        `record`.
+
+        Returns a tuple `(journal, journal_abbreviation)`.  If the journal is
+        not known, `(None, None)` is returned.
+        """
+        cls.ensure_loaded()
+
         journal = record.get('journal')
         shortjournal = record.get('shortjournal')
         logging.debug('journal = %s, shortjournal = %s', journal, shortjournal)
@@ -106,57 +326,148 @@ class Journals:
         return out
 
 
-def customize_key(record):
-    """Customize the BibTeX key."""
+class KeyTemplate:
+    """A compiled BibTeX key template.
+
+    The template is a format string as described for the config options
+    `<type>_key` in the sample config.  Compiling it determines which
+    substitutions it references, so `format` computes only those instead of
+    all possible substitutions.  Invalid templates raise a `ValueError`.
+    """
+
     MAX_AUTHORS = 100
     MAX_TITLE = 100
-    entrytype = record['ENTRYTYPE'].lower()
 
-    key = conf.get('bibtex', f'{entrytype}_key', fallback=None)
-    if key is None:
+    _AUTHOR_MAX = re.compile(r'author_max(\d+)(_?)')
+    _TITLE_MAX = re.compile(r'title_max(\d+)')
+    _FIELD_ROOT = re.compile(r'[^.[]*')
+
+    def __init__(self, template):
+        self.template = template
+        self.fields = set()
+        try:
+            for _, field_name, _, _ in string.Formatter().parse(template):
+                if field_name is None:
+                    continue
+                field = self._FIELD_ROOT.match(field_name).group()
+                if not field or field.isdigit():
+                    raise ValueError('positional fields are not supported')
+                self.fields.add(field)
+        except ValueError as exc:
+            raise ValueError(f'invalid key template {template!r}: {exc}')
+
+        self._author_fields = {
+            field for field in self.fields
+            if field in ('firstauthor', 'author')
+            or self._AUTHOR_MAX.fullmatch(field)}
+        self._title_fields = {field for field in self.fields
+                              if self._TITLE_MAX.fullmatch(field)}
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.template!r})'
+
+    def _author_substitutions(self, record, substitutions):
+        """Add the referenced substitutions derived from the authors."""
+        if not record.get('author'):
+            raise KeyError('author')
+        lastnames = authors.key_last_names(record['author'])
+        firstauthor = lastnames[0]
+        all_authors = ' '.join(lastnames)
+
+        for field in self._author_fields:
+            if field == 'firstauthor':
+                substitutions[field] = firstauthor
+            elif field == 'author':
+                substitutions[field] = all_authors
+            else:
+                match = self._AUTHOR_MAX.fullmatch(field)
+                i = int(match.group(1))
+                if 1 <= i < len(lastnames):
+                    if match.group(2):
+                        value = ' '.join(lastnames[:i]) + 'et al'
+                    else:
+                        value = firstauthor + 'et al'
+                    substitutions[field] = value
+                elif len(lastnames) <= i < self.MAX_AUTHORS:
+                    substitutions[field] = all_authors
+
+    def _title_substitutions(self, record, substitutions):
+        """Add the referenced substitutions derived from the title."""
+        title_words = record['title'].split()
+        for field in self._title_fields:
+            i = int(self._TITLE_MAX.fullmatch(field).group(1))
+            if 1 <= i < len(title_words):
+                substitutions[field] = ' '.join(title_words[:i])
+            elif len(title_words) <= i < self.MAX_TITLE:
+                substitutions[field] = ' '.join(title_words)
+
+    def format(self, record):
+        """Return the key of the BibTeX entry `record`.
+
+        Whitespace is not yet substituted.
+        """
+        substitutions = defaultdict(lambda: '')
+        for field in self.fields:
+            if field in record:
+                substitutions[field] = record[field]
+
+        if 'original_key' in self.fields:
+            substitutions['original_key'] = record['ID']
+
+        if ('shortjournal' in self.fields or 'shortjournal_' in self.fields):
+            shortjournal = record.get('shortjournal', record.get('journal'))
+            if 'shortjournal' not in record and shortjournal is not None:
+                substitutions['shortjournal'] = shortjournal
+            if 'shortjournal_' not in record and shortjournal is not None:
+                substitutions['shortjournal_'] = shortjournal.replace('.', '')
+
+        if self._author_fields:
+            self._author_substitutions(record, substitutions)
+        if self._title_fields:
+            self._title_substitutions(record, substitutions)
+
+        return self.template.format_map(substitutions)
+
+
+class KeyTemplates:
+    """The compiled BibTeX key templates of the config."""
+    #: Dict of the compiled templates by (lower case) entry type.
+    templates = None
+    #: Replacement of whitespace in the keys.
+    key_space = ''
+
+    @classmethod
+    def load(cls):
+        """Compile the key templates of the config section `bibtex`.
+
+        Raises a `ValueError` if a template is invalid.
+        """
+        templates = {}
+        for option, value in conf['bibtex'].items():
+            if option.endswith('_key'):
+                templates[option.removesuffix('_key')] = KeyTemplate(value)
+        cls.templates = templates
+        cls.key_space = conf.get('bibtex', 'key_space', fallback='')
+
+    @classmethod
+    def get(cls, entrytype):
+        """Return the template for `entrytype` or `None` if there is
+        none."""
+        if cls.templates is None:
+            cls.load()
+        return cls.templates.get(entrytype.lower())
+
+
+def customize_key(record):
+    """Customize the BibTeX key."""
+    template = KeyTemplates.get(record['ENTRYTYPE'])
+    if template is None:
         # don't change the BibTeX key
         return record
 
-    substitutions = defaultdict(lambda: '')
-    substitutions.update(record)
-
-    substitutions['original_key'] = record['ID']
-
-    if ('shortjournal' not in substitutions
-            and 'journal' in substitutions):
-        substitutions['shortjournal'] = substitutions['journal']
-    if ('shortjournal_' not in substitutions
-            and 'shortjournal' in substitutions):
-        substitutions['shortjournal_'] = (
-            substitutions['shortjournal'].replace('.', '')
-            )
-
-    # make a copy of record because bibc.author isn't a pure function
-    authors = bibc.author(record.copy())['author']
-    lastnames = [''.join(s for s in name.split(',')[0].split())
-                 for name in authors]
-    firstauthor = lastnames[0]
-    all_authors = ' '.join(lastnames)
-    substitutions['firstauthor'] = firstauthor
-    substitutions['author'] = all_authors
-    for i in range(1, len(authors)):
-        substitutions[f'author_max{i}'] = firstauthor + 'et al'
-        substitutions[f'author_max{i}_'] = ' '.join(lastnames[:i]) + 'et al'
-    for i in range(len(authors), MAX_AUTHORS):
-        substitutions[f'author_max{i}'] = all_authors
-        substitutions[f'author_max{i}_'] = all_authors
-
-    # make a copy of record because bibc.author isn't a pure function
-    title_words = record['title'].split()
-    for i in range(1, len(title_words)):
-        substitutions[f'title_max{i}'] = ' '.join(title_words[:i])
-    for i in range(len(title_words), MAX_TITLE):
-        substitutions[f'title_max{i}'] = ' '.join(title_words)
-
-    new_key = key.format_map(substitutions)
+    new_key = template.format(record)
     # remove whitespace
-    key_space = conf.get('bibtex', 'key_space', fallback='')
-    new_key = key_space.join(new_key.split())
+    new_key = KeyTemplates.key_space.join(new_key.split())
 
     record['ID'] = new_key
 
@@ -240,6 +551,27 @@ def normalize_doi(record):
     return record
 
 
+def canonical_doi(doi):
+    """Return the DOI `doi` in a canonical form to compare DOIs."""
+    return normalize_doi({'doi': doi})['doi'].strip().lower()
+
+
+_EPRINT_PREFIX = re.compile(
+    r'^(?:https?://)?(?:www\.)?(?:arxiv\.org/abs/)?(?:arxiv:)?',
+    re.IGNORECASE)
+_EPRINT_VERSION = re.compile(r'v\d+$')
+
+
+def canonical_eprint(eprint):
+    """Return the eprint `eprint` in a canonical form to compare eprints.
+
+    URL prefixes and the version are removed, e.g.,
+    'http://arxiv.org/abs/2101.00001v2' becomes '2101.00001'.
+    """
+    eprint = _EPRINT_PREFIX.sub('', eprint.strip())
+    return _EPRINT_VERSION.sub('', eprint).lower()
+
+
 def remove_empty_fields(record):
     """Remove empty fields and return the record."""
     emtpy_fields = [k for k, v in record.items() if not v]
@@ -248,43 +580,148 @@ def remove_empty_fields(record):
     return record
 
 
+#: Customizations registered with `register_customization` as tuples
+#: `(option, function, default)`.
+_registered_customizations = []
+
+
+def register_customization(option, function=None, default=False):
+    """Register `function` as an additional customization.
+
+    The customization is applied to every entry if the boolean config
+    option `bibtex.<option>` is true (default: `default`), after the built-in
+    customizations but before the BibTeX key is customized.  `function`
+    takes the record and returns the customized record.  If `function` is
+    omitted, a decorator is returned.
+    """
+    if function is None:
+        return lambda function: register_customization(option, function,
+                                                       default)
+    _registered_customizations.append((option, function, default))
+    return function
+
+
+def _import_customization(name):
+    """Import the customization `name` given as 'module:function'."""
+    module_name, _, function_name = name.partition(':')
+    if not function_name:
+        raise ValueError(f'invalid customization {name!r}: '
+                         "expected 'module:function'")
+    module = importlib.import_module(module_name)
+    return getattr(module, function_name)
+
+
+class Customizations:
+    """An ordered pipeline of customizations applied to BibTeX entries.
+
+    `steps` is a sequence of tuples `(name, function)`.  Calling the
+    pipeline with a record applies every function to the record in order
+    and returns the result.
+    """
+
+    def __init__(self, steps):
+        self._steps = tuple(steps)
+
+    @property
+    def steps(self):
+        """The tuple of steps `(name, function)`."""
+        return self._steps
+
+    def __bool__(self):
+        return bool(self._steps)
+
+    def __repr__(self):
+        names = ', '.join(name for name, _ in self._steps)
+        return f'{type(self).__name__}([{names}])'
+
+    def __call__(self, record):
+        for _, function in self._steps:
+            record = function(record)
+        return record
+
+    @classmethod
+    def from_config(cls, compact=False):
+        """Build the pipeline of customizations enabled in the config
+        section `bibtex`.
+
+        The config is read and validated only once, so applying the
+        pipeline doesn't depend on the config anymore.  If `compact` is
+        true, the entries are finally converted to `entry.Entry`, which is
+        worth it for entries kept in memory.  The pipeline is empty if
+        nothing is enabled.  Raises a `ValueError` for invalid settings.
+        """
+        def enabled(option, default=False):
+            return conf.getboolean('bibtex', option, fallback=default)
+
+        steps = []
+        if enabled('convert_month'):
+            steps.append(('convert_month', convert_month))
+
+        if enabled('abbreviate_journals'):
+            steps.append(('abbreviate_journals',
+                          customize_abbreviate_journal))
+        elif enabled('normalize_journals'):
+            steps.append(('normalize_journals', customize_journal))
+
+        if enabled('normalize_doi'):
+            steps.append(('normalize_doi', normalize_doi))
+
+        if enabled('remove_empty_fields'):
+            steps.append(('remove_empty_fields', remove_empty_fields))
+
+        _homogenize_latex_encoding = enabled('homogenize_latex_encoding')
+        _convert_to_unicode = enabled('convert_to_unicode')
+        if _homogenize_latex_encoding and _convert_to_unicode:
+            msg = ('invalid config settings: bibtex.homogenize_latex_encoding '
+                   'and bibtex.convert_to_unicode cannot be used together')
+            raise ValueError(msg)
+        elif _homogenize_latex_encoding:
+            latex.configure()
+            steps.append(('homogenize_latex_encoding',
+                          latex.homogenize_latex_encoding))
+        elif _convert_to_unicode:
+            latex.configure()
+            steps.append(('convert_to_unicode', latex.convert_to_unicode))
+
+        for option, function, default in _registered_customizations:
+            if enabled(option, default):
+                steps.append((option, function))
+
+        for name in conf.get('bibtex', 'customizations', fallback='').split():
+            steps.append((name, _import_customization(name)))
+
+        KeyTemplates.load()
+        if KeyTemplates.templates:
+            steps.append(('customize_key', customize_key))
+
+        if compact:
+            steps.append(('compact', entry.Entry.from_mapping))
+
+        if stats.enabled:
+            steps = [(name, stats.timed(f'customize.{name}', function))
+                     for name, function in steps]
+
+        return cls(steps)
+
+
 def customizations(record):
-    """Customize a BibTeX entry."""
-    if conf.getboolean('bibtex', 'convert_month', fallback=False):
-        record = convert_month(record)
-
-    if conf.getboolean('bibtex', 'abbreviate_journals', fallback=False):
-        record = customize_abbreviate_journal(record)
-    elif conf.getboolean('bibtex', 'normalize_journals', fallback=False):
-        record = customize_journal(record)
-
-    if conf.getboolean('bibtex', 'normalize_doi', fallback=False):
-        record = normalize_doi(record)
-
-    if conf.getboolean('bibtex', 'remove_empty_fields', fallback=False):
-        record = remove_empty_fields(record)
-
-    _homogenize_latex_encoding = conf.getboolean(
-        'bibtex', 'homogenize_latex_encoding', fallback=False)
-    _convert_to_unicode = conf.getboolean(
-        'bibtex', 'convert_to_unicode', fallback=False)
-    if _homogenize_latex_encoding and _convert_to_unicode:
-        msg = ('invalid config settings: bibtex.homogenize_latex_encoding and '
-               'bibtex.convert_to_unicode cannot be used together')
-        raise ValueError(msg)
-    elif _homogenize_latex_encoding:
-        record = bibc.homogenize_latex_encoding(record)
-    elif _convert_to_unicode:
-        record = bibc.convert_to_unicode(record)
-
-    record = customize_key(record)
+    """Customize a BibTeX entry according to the config.
 
-    return record
+    This builds the pipeline for every call; use `Customizations.from_config`
+    to customize many entries.
+    """
+    return Customizations.from_config()(record)
 
 
-def init_parser():
-    """Initialize and return a new BibTexParser."""
-    bparser = BibTexParser()
+def init_parser(compact=False):
+    """Initialize and return a new BibTexParser.
+
+    If `compact` is true, the parsed entries are stored as `entry.Entry`
+    (see `Customizations.from_config`).
+    """
+    from . import grammar
+
+    bparser = grammar.Parser()
 
     if 'common_strings' in conf['bibtex']:
         bparser.common_strings = conf.getboolean(
@@ -299,13 +736,144 @@ def init_parser():
         bparser.interpolate_bibtex_strings = conf.getboolean(
             'bibtex', 'interpolate_bibtex_strings')
 
-    bparser.customization = customizations
+    # build the customizations once to report errors before parsing
+    pipeline = Customizations.from_config(compact)
+    bparser.customization = pipeline if pipeline else None
 
     return bparser
 
 
+_BLOCK_CHARS = re.compile(r'[@{}()]')
+_BLOCK_TYPE = re.compile(r'@\s*[a-zA-Z]\w*\s*')
+_STRING_BLOCK = re.compile(r'@\s*string\s*[{(]', re.IGNORECASE)
+
+
+def _split_blocks(file, chunk_size=1 << 20):
+    """Split the BibTeX file object `file` into blocks and yield them.
+
+    Every block is a string starting with '@' and ending with the matching
+    closing brace (or parenthesis) of the entry, string, preamble or comment.
+    Text outside of blocks is dropped.  The file is read in chunks of
+    `chunk_size` characters, so only the current block is kept in memory.
+    """
+    pieces = []
+    in_block = False
+    delimiter = None
+    depth = 0
+    paren_depth = 0
+
+    while chunk := file.read(chunk_size):
+        start = 0
+        for match in _BLOCK_CHARS.finditer(chunk):
+            char = match.group()
+            pos = match.start()
+            if not in_block:
+                if char == '@':
+                    in_block = True
+                    delimiter = None
+                    start = pos
+                continue
+
+            if delimiter is None:
+                # looking for the delimiter after '@type'
+                if char == '@':
+                    pieces = []
+                    start = pos
+                elif (char in '{(' and _BLOCK_TYPE.fullmatch(
+                        ''.join(pieces) + chunk[start:pos])):
+                    delimiter = char
+                    depth = 1 if char == '{' else 0
+                    paren_depth = 1 if char == '(' else 0
+                else:
+                    # the '@' doesn't start a block, e.g. in a comment
+                    pieces = []
+                    in_block = False
+                continue
+
+            if char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+            elif delimiter == '(' and depth == 0:
+                paren_depth += 1 if char == '(' else -1 if char == ')' else 0
+
+            if ((delimiter == '{' and depth == 0)
+                    or (delimiter == '(' and paren_depth == 0)):
+                pieces.append(chunk[start:pos + 1])
+                yield ''.join(pieces)
+                pieces = []
+                in_block = False
+
+        if in_block:
+            pieces.append(chunk[start:])
+
+    if in_block and pieces:
+        # unterminated block; let the parser report it
+        yield ''.join(pieces)
+
+
+def read_strings(file, bparser=None):
+    """Return the dict of the BibTeX strings defined in the file object
+    `file`.
+
+    Only the @string blocks are parsed with `bparser`, which is created by
+    `init_parser` if it is `None`, so the strings are the same as after
+    parsing the whole file with it at a fraction of the cost.
+    """
+    if bparser is None:
+        bparser = init_parser()
+    bparser.expect_multiple_parse = True
+    for block in _split_blocks(file):
+        if _STRING_BLOCK.match(block):
+            with stats.timer('parse'):
+                bparser.parse(block, partial=True)
+    return bparser.bib_database.strings
+
+
+def iter_entries(file, bparser=None):
+    """Parse the BibTeX file object `file` incrementally and yield its
+    entries.
+
+    The entries are parsed (and customized) one by one with `bparser`, which
+    is created by `init_parser` if it is `None`.  Strings and preambles are
+    collected in `bparser.bib_database` as usual, so @string definitions are
+    interpolated into the following entries.  Entries and comments are not
+    kept, hence the memory usage only depends on the size of the largest
+    entry and not on the size of the file.
+    """
+    if bparser is None:
+        bparser = init_parser()
+    bparser.expect_multiple_parse = True
+    bib_database = bparser.bib_database
+
+    for block in _split_blocks(file):
+        with stats.timer('parse'):
+            bparser.parse(block, partial=True)
+        entries = bib_database.entries
+        bib_database.entries = []
+        bib_database.comments.clear()
+        yield from entries
+
+
+def parse_library_file(path):
+    """Parse the BibTeX file at `path` from the library and return the
+    BibDatabase.
+
+    Unlike `init_parser`, no customizations are applied because the files in
+    the library are already customized.
+    """
+    from . import grammar
+
+    bparser = grammar.Parser(ignore_nonstandard_types=False,
+                             customization=entry.Entry.from_mapping)
+    with open(path, 'r') as infile:
+        return bparser.parse_file(infile, partial=True)
+
+
 def init_writer():
     """Initialize and return a new BibTexWriter."""
+    from bibtexparser.bwriter import BibTexWriter
+
     bwriter = BibTexWriter()
     if 'add_trailing_comma' in conf['bibtex']:
         bwriter.add_trailing_comma = conf.getboolean(
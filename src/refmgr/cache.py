@@ -0,0 +1,168 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Cache completion results on disk."""
+
+import json
+import logging
+import os.path
+import sqlite3
+import time
+
+from . import conf
+from . import bibtex
+from . import stats
+
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class CompletionCache:
+    """A persistent cache of completion results.
+
+    The results are stored in an SQLite database at `path`, keyed by the
+    name of the completion and the normalized DOI.  A result is either a
+    JSON serializable value, e.g. the fields added by the completion (a
+    hit), or `None` if the completion found nothing (a miss).  Hits and
+    misses expire after `hit_ttl` and `miss_ttl` seconds, respectively.  If
+    the cache contains more than `max_entries` results, the oldest ones are
+    evicted.
+    """
+
+    def __init__(self, path, hit_ttl=90 * SECONDS_PER_DAY,
+                 miss_ttl=7 * SECONDS_PER_DAY, max_entries=100000):
+        self.path = path
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+        self.max_entries = max_entries
+        #: Number of lookups which were answered (hits) and not answered
+        #: (misses) by the cache.
+        self.lookups = {'hits': 0, 'misses': 0}
+
+        logging.debug('opening completion cache %s', path)
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'completion TEXT NOT NULL, '
+                'doi TEXT NOT NULL, '
+                'value TEXT, '
+                'stored REAL NOT NULL, '
+                'PRIMARY KEY (completion, doi))')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS results_stored ON results(stored)')
+
+    @classmethod
+    def from_config(cls, path):
+        """Return the cache at `path` configured by the config section
+        `cache`."""
+        return cls(
+            path,
+            hit_ttl=SECONDS_PER_DAY * conf.getfloat(
+                'cache', 'hit_ttl', fallback=90),
+            miss_ttl=SECONDS_PER_DAY * conf.getfloat(
+                'cache', 'miss_ttl', fallback=7),
+            max_entries=conf.getint('cache', 'max_entries', fallback=100000),
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the underlying database."""
+        self._conn.close()
+
+    def get(self, completion, doi):
+        """Return the cached result of `completion` for `doi`.
+
+        Returns a tuple `(found, value)` where `found` tells whether a
+        result was cached and `value` is the cached result.
+        """
+        row = self._conn.execute(
+            'SELECT value, stored FROM results WHERE completion=? AND doi=?',
+            (completion, bibtex.canonical_doi(doi))).fetchone()
+        if row is not None:
+            value, stored = row
+            ttl = self.miss_ttl if value is None else self.hit_ttl
+            if time.time() - stored <= ttl:
+                self.lookups['hits'] += 1
+                stats.count('cache.hits')
+                return True, None if value is None else json.loads(value)
+
+        self.lookups['misses'] += 1
+        stats.count('cache.misses')
+        return False, None
+
+    def put_many(self, completion, items):
+        """Store the results `items`, an iterable of tuples `(doi, value)`,
+        of `completion`.
+
+        `value` is `None` if the completion found nothing.
+        """
+        now = time.time()
+        rows = [(completion, bibtex.canonical_doi(doi),
+                 None if value is None else json.dumps(value), now)
+                for doi, value in items]
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)', rows)
+        self.evict()
+
+    def put(self, completion, doi, value):
+        """Store the result `value` of `completion` for `doi`."""
+        self.put_many(completion, [(doi, value)])
+
+    def evict(self):
+        """Remove expired results and the oldest results exceeding
+        `max_entries`."""
+        now = time.time()
+        with self._conn:
+            self._conn.execute(
+                'DELETE FROM results WHERE '
+                '(value IS NULL AND stored < ?) OR '
+                '(value IS NOT NULL AND stored < ?)',
+                (now - self.miss_ttl, now - self.hit_ttl))
+            count, = self._conn.execute(
+                'SELECT COUNT(*) FROM results').fetchone()
+            if count > self.max_entries:
+                logging.debug('evicting %s completion results',
+                              count - self.max_entries)
+                self._conn.execute(
+                    'DELETE FROM results WHERE rowid IN ('
+                    'SELECT rowid FROM results ORDER BY stored LIMIT ?)',
+                    (count - self.max_entries,))
+
+    def clear(self):
+        """Remove all results from the cache."""
+        with self._conn:
+            self._conn.execute('DELETE FROM results')
+        self._conn.execute('VACUUM')
+
+    def stats(self):
+        """Return a dict with statistics about the cache."""
+        stats = {'path': self.path,
+                 'size': os.path.getsize(self.path)}
+        for completion, hits, misses in self._conn.execute(
+                'SELECT completion, COUNT(value), COUNT(*) - COUNT(value) '
+                'FROM results GROUP BY completion ORDER BY completion'):
+            stats[f'{completion}.hits'] = hits
+            stats[f'{completion}.misses'] = misses
+        return stats
@@ -0,0 +1,409 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Catalog of the entries in the library."""
+
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+import re
+import sqlite3
+import warnings
+
+from . import authors
+from . import bibtex
+from . import duplicates
+from . import latex
+
+
+#: Version of the database layout.  Catalogs with an older version are
+#: rebuilt from scratch.
+SCHEMA_VERSION = 4
+
+
+class Catalog:
+    """A persistent catalog of the entries in the library.
+
+    The catalog is stored in an SQLite database at `path`.  For every
+    BibTeX file of the library, the modification time and size are stored
+    together with the key, DOI, eprint, title and authors of its entries, so
+    entries can be looked up without parsing the library.  The titles,
+    abstracts, authors, keywords and journals are indexed for full-text
+    search with `search_text`.
+    """
+
+    #: Columns of the full-text index and their weights in the ranking by
+    #: `search_text`, in the order of `_search_row`.
+    SEARCH_WEIGHTS = {'title': 10.0, 'abstract': 1.0, 'author': 5.0,
+                      'keywords': 5.0, 'journal': 2.0}
+
+    def __init__(self, path):
+        self.path = path
+
+        logging.debug('opening catalog %s', path)
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA foreign_keys=ON')
+        version, = self._conn.execute('PRAGMA user_version').fetchone()
+        if version < SCHEMA_VERSION:
+            logging.info('catalog %s is outdated; run refmgr index', path)
+            with self._conn:
+                for table in ('search', 'authors', 'fingerprints', 'entries',
+                              'files'):
+                    self._conn.execute(f'DROP TABLE IF EXISTS {table}')
+                self._conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS files ('
+                'path TEXT PRIMARY KEY, '
+                'mtime INTEGER NOT NULL, '
+                'size INTEGER NOT NULL)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'id INTEGER PRIMARY KEY, '
+                'key TEXT NOT NULL, '
+                'doi TEXT, '
+                'eprint TEXT, '
+                'title TEXT, '
+                'path TEXT NOT NULL '
+                'REFERENCES files(path) ON DELETE CASCADE)')
+            for column in ('key', 'doi', 'eprint', 'path'):
+                self._conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS entries_{column} '
+                    f'ON entries({column})')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS fingerprints ('
+                'fingerprint TEXT NOT NULL, '
+                'key TEXT NOT NULL, '
+                'path TEXT NOT NULL '
+                'REFERENCES files(path) ON DELETE CASCADE)')
+            for column in ('fingerprint', 'path'):
+                self._conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS fingerprints_{column} '
+                    f'ON fingerprints({column})')
+            # lastname and fullname are the normalized last name without
+            # and with the von part
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS authors ('
+                'key TEXT NOT NULL, '
+                'position INTEGER NOT NULL, '
+                'last TEXT NOT NULL, '
+                'first TEXT NOT NULL, '
+                'von TEXT NOT NULL, '
+                'jr TEXT NOT NULL, '
+                'lastname TEXT NOT NULL, '
+                'fullname TEXT NOT NULL, '
+                'path TEXT NOT NULL '
+                'REFERENCES files(path) ON DELETE CASCADE)')
+            for column in ('lastname', 'fullname', 'path'):
+                self._conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS authors_{column} '
+                    f'ON authors({column})')
+            # full-text index whose rowids are the ids of the entries;
+            # diacritics are removed, so accents needn't be typed
+            columns = ', '.join(self.SEARCH_WEIGHTS)
+            self._conn.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5('
+                f"{columns}, tokenize='unicode61 remove_diacritics 2')")
+            self._conn.execute(
+                'CREATE TRIGGER IF NOT EXISTS entries_search_delete '
+                'AFTER DELETE ON entries BEGIN '
+                'DELETE FROM search WHERE rowid=old.id; END')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the underlying database."""
+        self._conn.close()
+
+    @staticmethod
+    def _entry_row(entry, path):
+        """Return the row of the table `entries` for `entry`."""
+        doi = entry.get('doi')
+        eprint = entry.get('eprint')
+        return (entry['ID'],
+                None if doi is None else bibtex.canonical_doi(doi),
+                None if eprint is None else bibtex.canonical_eprint(eprint),
+                entry.get('title'),
+                path)
+
+    @staticmethod
+    def _search_row(entry):
+        """Return the row of the table `search` for `entry` without the
+        rowid."""
+        names = ()
+        if entry.get('author'):
+            names = authors.parse_names(entry['author'])
+        author = ' '.join(part for name in names for part in name if part)
+        journal = entry.get('journal') or entry.get('booktitle', '')
+        return [_search_text(value) for value in (
+            entry.get('title', ''), entry.get('abstract', ''), author,
+            entry.get('keywords', ''), journal)]
+
+    @staticmethod
+    def _author_rows(entry, path):
+        """Return the rows of the table `authors` for `entry`."""
+        if not entry.get('author'):
+            return []
+        return [(entry['ID'], position, *name,
+                 authors.normalize(name.last),
+                 authors.normalize(f'{name.von} {name.last}'), path)
+                for position, name
+                in enumerate(authors.parse_names(entry['author']))]
+
+    def _update_file(self, path, entries, stat):
+        """Replace the entries of the file at `path` without committing."""
+        self._conn.execute('DELETE FROM files WHERE path=?', (path,))
+        self._conn.execute('INSERT INTO files VALUES (?, ?, ?)',
+                           (path, stat.st_mtime_ns, stat.st_size))
+        for entry in entries:
+            cursor = self._conn.execute(
+                'INSERT INTO entries(key, doi, eprint, title, path) '
+                'VALUES (?, ?, ?, ?, ?)', self._entry_row(entry, path))
+            self._conn.execute(
+                'INSERT INTO search(rowid, title, abstract, author, '
+                'keywords, journal) VALUES (?, ?, ?, ?, ?, ?)',
+                (cursor.lastrowid, *self._search_row(entry)))
+        self._conn.executemany(
+            'INSERT INTO fingerprints VALUES (?, ?, ?)',
+            [(fingerprint, entry['ID'], path) for entry in entries
+             for fingerprint in duplicates.fingerprints(entry)])
+        self._conn.executemany(
+            'INSERT INTO authors VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [row for entry in entries
+             for row in self._author_rows(entry, path)])
+
+    def update_file(self, path, entries):
+        """Replace the entries of the library file at `path` with
+        `entries`."""
+        self.update_files([(path, entries)])
+
+    def update_files(self, files):
+        """Replace the entries of several library files in a single
+        transaction.
+
+        `files` is an iterable of tuples `(path, entries)`.
+        """
+        with self._conn:
+            for path, entries in files:
+                logging.debug('updating catalog for %s', path)
+                self._update_file(path, entries, os.stat(path))
+
+    def remove_file(self, path):
+        """Remove the library file at `path` from the catalog."""
+        with self._conn:
+            self._conn.execute('DELETE FROM files WHERE path=?', (path,))
+
+    def clear(self):
+        """Remove all files from the catalog."""
+        with self._conn:
+            self._conn.execute('DELETE FROM files')
+
+    def update(self, library, jobs=1):
+        """Update the catalog with the BibTeX files in the directory
+        `library`.
+
+        Only files which are new or whose modification time or size changed
+        are parsed, by `jobs` processes if there are several files.  Returns
+        a dict with the numbers of updated, removed and unchanged files.
+        """
+        known = {path: (mtime, size) for path, mtime, size
+                 in self._conn.execute('SELECT path, mtime, size FROM files')}
+        counts = {'updated': 0, 'removed': 0, 'unchanged': 0}
+
+        changed = []
+        with os.scandir(library) as it:
+            for dir_entry in it:
+                if (not dir_entry.name.endswith('.bib')
+                        or not dir_entry.is_file()):
+                    continue
+                stat = dir_entry.stat()
+                if known.pop(dir_entry.path, None) == (stat.st_mtime_ns,
+                                                       stat.st_size):
+                    counts['unchanged'] += 1
+                else:
+                    changed.append((dir_entry.path, stat))
+
+        with self._conn:
+            results = _parse_files([path for path, _ in changed], jobs)
+            for (path, stat), result in zip(changed, results):
+                if isinstance(result, Exception):
+                    msg = f'skipping indexing {path}: {result}'
+                    warnings.warn(msg, RuntimeWarning)
+                    continue
+                self._update_file(path, result, stat)
+                counts['updated'] += 1
+
+            for path in known:
+                self._conn.execute('DELETE FROM files WHERE path=?', (path,))
+                counts['removed'] += 1
+
+        return counts
+
+    def paths(self):
+        """Return the list of paths of the library files in the catalog."""
+        return [path for path, in self._conn.execute(
+            'SELECT path FROM files ORDER BY path')]
+
+    def lookup(self, key=None, doi=None, eprint=None, author=None):
+        """Return the entries matching all given criteria.
+
+        `author` matches the last name of an author with or without the von
+        part, ignoring case, accents and punctuation.
+
+        Returns a list of tuples `(key, doi, eprint, title, path)`.  If no
+        criterion is given, an empty list is returned.
+        """
+        conditions = []
+        params = []
+        if key is not None:
+            conditions.append('key=?')
+            params.append(key)
+        if doi is not None:
+            conditions.append('doi=?')
+            params.append(bibtex.canonical_doi(doi))
+        if eprint is not None:
+            conditions.append('eprint=?')
+            params.append(bibtex.canonical_eprint(eprint))
+        if author is not None:
+            conditions.append(
+                'EXISTS (SELECT 1 FROM authors AS a '
+                'WHERE a.key=entries.key AND a.path=entries.path '
+                'AND (a.lastname=? OR a.fullname=?))')
+            params.extend([authors.normalize(author)] * 2)
+        if not conditions:
+            return []
+
+        query = ('SELECT key, doi, eprint, title, path FROM entries WHERE '
+                 + ' AND '.join(conditions) + ' ORDER BY key, path')
+        return self._conn.execute(query, params).fetchall()
+
+    def search_text(self, query, limit=20):
+        """Return the entries best matching the full-text search `query`.
+
+        `query` is a string of words, which may contain LaTeX code; all of
+        them have to occur in the title, abstract, authors, keywords or
+        journal of an entry.  A word ending with `*` matches all words
+        starting with it.  The entries are ranked by BM25 with the weights
+        `SEARCH_WEIGHTS`.
+
+        Returns a list of at most `limit` tuples `(key, doi, eprint, title,
+        path)`, the best match first.
+        """
+        expression = _match_expression(query)
+        if not expression:
+            return []
+        weights = ', '.join(str(w) for w in self.SEARCH_WEIGHTS.values())
+        # rank before joining, so only the best matches are joined
+        return self._conn.execute(
+            'SELECT key, doi, eprint, title, path FROM entries JOIN ('
+            f'SELECT rowid, bm25(search, {weights}) AS score FROM search '
+            'WHERE search MATCH ? ORDER BY score LIMIT ?) AS matches '
+            'ON entries.id=matches.rowid ORDER BY matches.score',
+            (expression, limit)).fetchall()
+
+    def search(self, query):
+        """Return the entries whose key, DOI or eprint equals `query`.
+
+        Returns a list of tuples like `lookup`.
+        """
+        return self._conn.execute(
+            'SELECT key, doi, eprint, title, path FROM entries '
+            'WHERE key=? OR doi=? OR eprint=? ORDER BY key, path',
+            (query, bibtex.canonical_doi(query),
+             bibtex.canonical_eprint(query))).fetchall()
+
+    def find_fingerprints(self, fingerprints):
+        """Return the first entry with one of the given `fingerprints` as
+        tuple `(key, path)` or `None` if there is none."""
+        for fingerprint in fingerprints:
+            row = self._conn.execute(
+                'SELECT key, path FROM fingerprints WHERE fingerprint=? '
+                'LIMIT 1', (fingerprint,)).fetchone()
+            if row is not None:
+                return row
+        return None
+
+    def fingerprint_paths(self, fingerprints):
+        """Return the set of paths of the library files with an entry with
+        one of the given `fingerprints`."""
+        paths = set()
+        for fingerprint in fingerprints:
+            paths.update(path for path, in self._conn.execute(
+                'SELECT path FROM fingerprints WHERE fingerprint=?',
+                (fingerprint,)))
+        return paths
+
+    def file_fingerprints(self, path):
+        """Return the set of fingerprints of the entries of the library
+        file at `path` or `None` if the file is not in the catalog."""
+        if self._conn.execute('SELECT 1 FROM files WHERE path=?',
+                              (path,)).fetchone() is None:
+            return None
+        return {fingerprint for fingerprint, in self._conn.execute(
+            'SELECT fingerprint FROM fingerprints WHERE path=?', (path,))}
+
+
+_WORD = re.compile(r'\w+\*?')
+
+
+def _search_text(value):
+    """Return the field value `value` as text for the full-text index.
+
+    The words with LaTeX code are converted to unicode one by one, since
+    they repeat much more than whole values, and the braces are removed.
+    """
+    if '\\' in value:
+        value = ' '.join(latex.to_unicode(word) if '\\' in word else word
+                         for word in value.split())
+    return value.replace('{', '').replace('}', '')
+
+
+def _match_expression(query):
+    """Return the FTS5 expression matching all words of `query` or an empty
+    string if it contains no words."""
+    words = _WORD.findall(_search_text(query))
+    return ' '.join(f'"{word.rstrip("*")}"' + ('*' if word.endswith('*')
+                                              else '')
+                    for word in words)
+
+
+def _parse_entries(path):
+    """Return the entries of the library file at `path` or the exception
+    raised while parsing it."""
+    try:
+        return bibtex.parse_library_file(path).entries
+    except Exception as exc:
+        return exc
+
+
+def _parse_files(paths, jobs):
+    """Yield the entries of the library files at `paths` or the exceptions
+    raised while parsing them in the same order.
+
+    The files are parsed by `jobs` processes if there are several.
+    """
+    if jobs <= 1 or len(paths) <= 1:
+        yield from map(_parse_entries, paths)
+        return
+    chunksize = max(1, min(64, len(paths) // (4 * jobs)))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(_parse_entries, paths, chunksize=chunksize)
@@ -17,11 +17,20 @@
 
 """Complete references with online information."""
 
+from concurrent.futures import ThreadPoolExecutor
 import enum
+import itertools
 import warnings
 import logging
+import os
+import threading
+import time
 
-import arxiv
+from . import conf
+from . import stats
+
+# arxiv (and its HTTP stack) is imported by the functions using it because
+# importing it is slow and it is only needed for completing references.
 
 
 class Completion(enum.Enum):
@@ -31,16 +40,18 @@ class Completion(enum.Enum):
     ARXIV = enum.auto()
 
 
-def complete(record, completions):
+def complete(record, completions, cache=None):
     """Complete the BibTeX reference `record` with the given `completions`
     and return it.
 
-    `completions` needs to be a sequence of `Completion` instances.
+    `completions` needs to be a sequence of `Completion` instances.  If
+    `cache` is a `cache.CompletionCache`, results are looked up there first
+    and new results are stored there.
     """
     for completion in completions:
         match completion:
             case Completion.ARXIV:
-                record = add_arxiv(record)
+                record = add_arxiv(record, cache)
             case _:
                 msg = f'skipping completing {completion}: not implemented'
                 warnings.warn(msg)
@@ -48,6 +59,45 @@ def complete(record, completions):
     return record
 
 
+def complete_many(records, completions, cache=None):
+    """Complete the BibTeX references `records` with the given `completions`
+    and return them as a list.
+
+    Like `complete` but the records are completed in batches where possible,
+    e.g., with one arXiv query for many records.
+    """
+    if not completions:
+        return records if isinstance(records, list) else list(records)
+    records = list(records)
+    for completion in completions:
+        match completion:
+            case Completion.ARXIV:
+                records = add_arxiv_many(records, cache)
+            case _:
+                msg = f'skipping completing {completion}: not implemented'
+                warnings.warn(msg)
+
+    return records
+
+
+def iter_complete(records, completions, cache=None, batch_size=None):
+    """Complete the BibTeX references of the iterable `records` with the
+    given `completions` and yield them in the same order.
+
+    The records are completed with `complete_many` in batches of
+    `batch_size` records (default: the config option
+    `complete.batch_size`).
+    """
+    if batch_size is None:
+        batch_size = conf.getint('complete', 'batch_size', fallback=100)
+
+    records = iter(records)
+    while batch := list(itertools.islice(records, batch_size)):
+        with stats.timer('complete'):
+            batch = complete_many(batch, completions, cache)
+        yield from batch
+
+
 def dois_match(doi1, doi2):
     logging.debug('doi1: %s', doi1)
     logging.debug('doi2: %s', doi2)
@@ -58,37 +108,255 @@ def dois_match(doi1, doi2):
     return doi1 in doi2 or doi2 in doi1
 
 
-def add_arxiv(record):
-    """Search for arXiv information and add it to the record.
+# paths of snapshots which could not be opened
+_broken_snapshots = set()
 
-    Returns the modified record.
+
+def _arxiv_snapshot():
+    """Return the `snapshot.ArxivSnapshot` configured by the config option
+    `complete.arxiv_snapshot` or `None`.
+
+    The snapshot is opened on first use.  If it cannot be opened, a warning
+    is issued once and `None` is returned, so arXiv is searched online.
     """
-    if 'doi' not in record:
-        msg = ("arxiv completion not possible for {record['ID']}: "
-               "no DOI available")
+    path = conf.get('complete', 'arxiv_snapshot', fallback=None)
+    if not path or path in _broken_snapshots:
+        return None
+
+    from . import snapshot
+
+    try:
+        return snapshot.open_snapshot(os.path.expanduser(path))
+    except (OSError, ValueError) as exc:
+        _broken_snapshots.add(path)
+        msg = f'arxiv snapshot {path} not used: {exc}'
         warnings.warn(msg, RuntimeWarning)
-        logging.debug(msg)
-        return record
+        return None
+
+
+class _RateLimiter:
+    """Allow at most one call of `wait` every `delay` seconds, shared
+    between threads."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._next = 0.0
 
-    query=f"all:{record['doi']}"
-    search = arxiv.Search(query=query)
-    matches = [result for result in search.results()
-               if dois_match(result.doi, record['doi'])]
+    def wait(self):
+        """Block until the next call is allowed."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next:
+                time.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.delay
+
+
+def _arxiv_client(page_size=100):
+    """Return a new arxiv.Client configured by the config section
+    `complete`."""
+    import arxiv
+
+    client = arxiv.Client(page_size=page_size, delay_seconds=0)
+    url = conf.get('complete', 'arxiv_url', fallback=None)
+    if url is not None:
+        client.query_url_format = url + '?{}'
+    return client
+
+
+def _arxiv_fields(result):
+    """Return the fields added to a record for the arXiv search result
+    `result`."""
+    return {'eprint': result.entry_id,
+            'eprintclass': result.primary_category,
+            'eprinttype': 'arxiv'}
+
+
+def _add_arxiv_match(record, matches):
+    """Add the fields of the only element of `matches` to `record` and
+    return it.
+
+    `matches` is a list of dicts as returned by `_arxiv_fields`.  If it
+    doesn't contain exactly one match, a warning is issued and the record is
+    returned unchanged.
+    """
     logging.debug('matches: %s', str(matches))
     if not matches:
-        msg = ("arxiv completion not possible for {record['ID']}: "
+        msg = (f"arxiv completion not possible for {record['ID']}: "
                "no matching arxiv articles found")
         warnings.warn(msg, RuntimeWarning)
         return record
     if len(matches) > 1:
-        msg = ("arxiv completion not possible for {record['ID']}: "
+        msg = (f"arxiv completion not possible for {record['ID']}: "
                "more than one matching arxiv articles found")
         warnings.warn(msg, RuntimeWarning)
         return record
 
-    match = matches[0]
-    record['eprint'] = match.entry_id
-    record['eprintclass'] = match.primary_category
-    record['eprinttype'] = 'arxiv'
+    record.update(matches[0])
 
     return record
+
+
+def _warn_no_doi(record):
+    """Warn that `record` cannot be completed with arXiv information."""
+    msg = (f"arxiv completion not possible for {record['ID']}: "
+           "no DOI available")
+    warnings.warn(msg, RuntimeWarning)
+    logging.debug(msg)
+
+
+def _get_cached(cache, doi):
+    """Return the cached arXiv matches for `doi` or `None` if there are
+    none."""
+    if cache is None:
+        return None
+    found, value = cache.get('arxiv', doi)
+    if not found:
+        return None
+    # misses are stored as None
+    return [] if value is None else value
+
+
+def add_arxiv(record, cache=None):
+    """Search for arXiv information and add it to the record.
+
+    If `cache` is given, the search result is looked up there first.  If an
+    arXiv snapshot is configured (see `_arxiv_snapshot`), it is searched
+    instead of arXiv.  Returns the modified record.
+    """
+    if 'doi' not in record:
+        _warn_no_doi(record)
+        return record
+
+    snapshot = _arxiv_snapshot()
+    if snapshot is not None:
+        stats.count('complete.arxiv.snapshot')
+        return _add_arxiv_match(record, snapshot.lookup(record['doi']))
+
+    matches = _get_cached(cache, record['doi'])
+    if matches is None:
+        import arxiv
+
+        query=f"all:{record['doi']}"
+        search = arxiv.Search(query=query)
+        stats.count('complete.arxiv.requests')
+        with stats.timer('complete.arxiv.request'):
+            matches = [_arxiv_fields(result)
+                       for result in _arxiv_client().results(search)
+                       if dois_match(result.doi, record['doi'])]
+        if cache is not None:
+            cache.put('arxiv', record['doi'], matches or None)
+
+    return _add_arxiv_match(record, matches)
+
+
+def _search_arxiv_dois(dois, limiter):
+    """Search for the arXiv articles of all `dois` with a single query.
+
+    Returns a tuple `(results, truncated)` of the list of results and
+    whether their number reached the maximal number of results, so results
+    may be missing.
+    """
+    import arxiv
+
+    query = ' OR '.join(f'all:"{doi}"' for doi in dois)
+    max_results = conf.getint('complete', 'arxiv_max_results',
+                              fallback=5 * len(dois))
+    search = arxiv.Search(query=query, max_results=max_results)
+    limiter.wait()
+    logging.debug('arxiv query: %s', query)
+    stats.count('complete.arxiv.requests')
+    with stats.timer('complete.arxiv.request'):
+        results = list(_arxiv_client(max_results).results(search))
+    return results, len(results) >= max_results
+
+
+def _find_arxiv_dois(dois, limiter):
+    """Search for the arXiv articles of all `dois`.
+
+    Returns a tuple `(matches, incomplete)` of a dict mapping the DOIs to
+    the lists of fields of their articles (see `_arxiv_fields`) and the set
+    of DOIs whose articles may have been missed.  The DOIs are searched with
+    a single query; if its results are truncated, the DOIs without matches
+    are searched again one by one.
+    """
+    results, truncated = _search_arxiv_dois(dois, limiter)
+    matches = {doi: [_arxiv_fields(result) for result in results
+                     if dois_match(result.doi, doi)]
+               for doi in dois}
+    incomplete = set()
+    if not truncated:
+        return matches, incomplete
+
+    stats.count('complete.arxiv.truncated')
+    for doi in dois:
+        if matches[doi]:
+            continue
+        if len(dois) == 1:
+            incomplete.add(doi)
+            continue
+        logging.debug('searching %s again: results truncated', doi)
+        retry, retry_incomplete = _find_arxiv_dois([doi], limiter)
+        matches.update(retry)
+        incomplete |= retry_incomplete
+    return matches, incomplete
+
+
+def add_arxiv_many(records, cache=None):
+    """Search for arXiv information of all `records` and add it to them.
+
+    The DOIs of the records are combined into queries of
+    `complete.arxiv_batch_size` DOIs (default: 20), which are sent by at
+    most `complete.arxiv_workers` threads (default: 1) with a delay of at
+    least `complete.arxiv_delay` seconds between two queries (default: 3).
+    The results are matched to the records with `dois_match`, so the
+    warnings are the same as for `add_arxiv`.  DOIs without matches in a
+    query whose results were truncated by `complete.arxiv_max_results` are
+    queried again one by one.  DOIs found in `cache` are not queried.  If
+    an arXiv snapshot is configured, nothing is queried.
+
+    Returns the list of modified records.
+    """
+    records = list(records)
+    snapshot = _arxiv_snapshot()
+    if snapshot is not None:
+        return [add_arxiv(record) for record in records]
+
+    batch_size = conf.getint('complete', 'arxiv_batch_size', fallback=20)
+    workers = conf.getint('complete', 'arxiv_workers', fallback=1)
+    delay = conf.getfloat('complete', 'arxiv_delay', fallback=3.0)
+
+    matches = {}
+    for record in records:
+        if 'doi' in record and record['doi'] not in matches:
+            cached = _get_cached(cache, record['doi'])
+            if cached is not None:
+                matches[record['doi']] = cached
+
+    dois = list(dict.fromkeys(record['doi'] for record in records
+                              if 'doi' in record
+                              and record['doi'] not in matches))
+    batches = [dois[i:i + batch_size]
+               for i in range(0, len(dois), batch_size)]
+    limiter = _RateLimiter(delay)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_find_arxiv_dois, batch, limiter)
+                   for batch in batches]
+        for batch, future in zip(batches, futures):
+            batch_matches, incomplete = future.result()
+            matches.update(batch_matches)
+            if cache is not None:
+                # misses of truncated searches are searched again next time
+                cache.put_many('arxiv', [(doi, matches[doi] or None)
+                                         for doi in batch
+                                         if doi not in incomplete])
+
+    for record in records:
+        if 'doi' not in record:
+            _warn_no_doi(record)
+            continue
+        _add_arxiv_match(record, matches[record['doi']])
+
+    return records
@@ -17,18 +17,17 @@
 """Config of refmgr."""
 
 import configparser
+import importlib.resources
 import logging
 import shutil
 
-import pkg_resources
-
 
 def init(path):
     """Initialize a config file at `path`."""
     logging.debug(f"trying to read sample config file")
-    sample_conf = pkg_resources.resource_stream(__name__, 'data/sample.conf')
+    sample_path = importlib.resources.files(__package__) / 'data/sample.conf'
     logging.debug(f"trying to initialize config file '{path}'")
-    with open(path, 'xb') as outfile:
+    with sample_path.open('rb') as sample_conf, open(path, 'xb') as outfile:
         shutil.copyfileobj(sample_conf, outfile)
         logging.debug(f"config file '{path}' succesfully initialized")
 
@@ -0,0 +1,268 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Resident daemon running refmgr commands.
+
+`refmgr serve` keeps the imported modules, the journal abbreviations, the
+caches and the open databases of the library in memory and runs the
+commands sent to it on a Unix socket, so they don't pay for starting up.
+There is one daemon per config file; its socket is `socket_path(config)`.
+
+The protocol is one JSON object per line.  The client sends
+`{"argv": [...], "cwd": "..."}` with the command line arguments after
+`refmgr` and its working directory, and the daemon answers with
+`{"status": ..., "stdout": "...", "stderr": "..."}` after running the
+command.  Commands are run one after another.
+
+This module is imported by the CLI, so the client side only uses light
+modules.
+"""
+
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import warnings
+import zlib
+
+from . import conf
+from . import config
+
+
+def socket_path(config_path):
+    """Return the path of the socket of the daemon using the config file at
+    `config_path`."""
+    dirname = (os.environ.get('XDG_RUNTIME_DIR')
+               or os.environ.get('TMPDIR') or '/tmp')
+    digest = zlib.crc32(os.fsencode(config_path))
+    return os.path.join(dirname, f'refmgr-{os.getuid()}-{digest:08x}.sock')
+
+
+def forward(config_path, argv):
+    """Run the command line arguments `argv` by the daemon using the config
+    file at `config_path` and return the exit status.
+
+    The output of the command is written to stdout and stderr.  Returns
+    `None` if no daemon is running, so the command has to be run by the
+    caller.
+    """
+    path = socket_path(config_path)
+    try:
+        # don't talk to sockets of other users
+        if os.stat(path).st_uid != os.getuid():
+            return None
+    except OSError:
+        return None
+
+    import socket
+
+    request = {'argv': argv, 'cwd': os.getcwd()}
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            with sock.makefile('rwb') as stream:
+                stream.write(json.dumps(request).encode('utf-8') + b'\n')
+                stream.flush()
+                line = stream.readline()
+    except (ConnectionRefusedError, FileNotFoundError):
+        # stale socket of a daemon which is gone
+        return None
+    if not line:
+        print('refmgr: the daemon exited while running the command',
+              file=sys.stderr)
+        return 1
+
+    response = json.loads(line)
+    sys.stdout.write(response['stdout'])
+    sys.stdout.flush()
+    sys.stderr.write(response['stderr'])
+    return response['status']
+
+
+def _exit_status(exc):
+    """Return the exit status of the `SystemExit` `exc` like the
+    interpreter, printing a message to stderr."""
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    print(exc.code, file=sys.stderr)
+    return 1
+
+
+class Server:
+    """Daemon running the commands `commands` sent to the socket at `path`
+    with the config file at `config_path`.
+
+    `commands` is a set of the functions of the CLI which may be run.  The
+    config is read again whenever the config file changes.
+    """
+
+    def __init__(self, config_path, path, commands):
+        self.config_path = config_path
+        self.path = path
+        self.commands = commands
+        self._config_stamp = None
+
+    def _stamp(self):
+        """Return the modification time and size of the config file."""
+        try:
+            stat = os.stat(self.config_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload_config(self):
+        """Read the config file again if it changed since it was read.
+
+        Returns whether it was read.
+        """
+        stamp = self._stamp()
+        if stamp == self._config_stamp:
+            return False
+        logging.info('loading config %s', self.config_path)
+        conf.clear()
+        conf.read_dict(config.default())
+        config.load(conf, self.config_path)
+        self._config_stamp = stamp
+        return True
+
+    def warm_up(self):
+        """Import the modules and load the data needed by the commands."""
+        from . import bibtex
+        from . import references
+
+        try:
+            bibtex.init_parser()
+            if (conf.getboolean('bibtex', 'abbreviate_journals',
+                                fallback=False)
+                    or conf.getboolean('bibtex', 'normalize_journals',
+                                       fallback=False)):
+                bibtex.Journals.ensure_loaded()
+            references.library_catalog()
+        except Exception as exc:
+            # the commands report the error
+            logging.info('warming up failed: %s', exc)
+        try:
+            import arxiv  # noqa: F401
+        except ImportError:
+            pass
+
+    def run(self, argv, cwd):
+        """Run the command line arguments `argv` in the directory `cwd`.
+
+        Returns a tuple `(status, stdout, stderr)`.
+        """
+        from . import ui
+
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        status = 0
+        with contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr), \
+                warnings.catch_warnings():
+            # changing the filters forgets the warnings shown before, so
+            # every command shows its warnings like a new process
+            warnings.filterwarnings('default', append=True)
+            try:
+                os.chdir(cwd)
+                if self.reload_config():
+                    self.warm_up()
+                args = ui.parse_args(argv)
+                if getattr(args, 'func', None) not in self.commands:
+                    sys.exit('refmgr: the daemon cannot run this command')
+                args.func(args)
+            except SystemExit as exc:
+                status = _exit_status(exc)
+            except Exception:
+                import traceback
+
+                traceback.print_exc()
+                status = 1
+        return status, stdout.getvalue(), stderr.getvalue()
+
+    def _handle(self, conn):
+        """Run the command sent on the connection `conn`."""
+        with conn, conn.makefile('rwb') as stream:
+            line = stream.readline()
+            if not line:
+                return
+            try:
+                request = json.loads(line)
+                argv = [str(arg) for arg in request['argv']]
+                cwd = str(request['cwd'])
+            except (ValueError, KeyError, TypeError) as exc:
+                response = {'status': 2, 'stdout': '',
+                            'stderr': f'refmgr: invalid request: {exc}\n'}
+            else:
+                status, stdout, stderr = self.run(argv, cwd)
+                response = {'status': status, 'stdout': stdout,
+                            'stderr': stderr}
+            stream.write(json.dumps(response).encode('utf-8') + b'\n')
+
+    def _bind(self):
+        """Return a socket listening at `path`.
+
+        A stale socket is replaced; raises a `RuntimeError` if another
+        daemon listens there.
+        """
+        import socket
+
+        if os.path.exists(self.path):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(self.path)
+                except OSError:
+                    os.unlink(self.path)
+                else:
+                    msg = f'a daemon is already running at {self.path}'
+                    raise RuntimeError(msg)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o077)
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(umask)
+        sock.listen()
+        return sock
+
+    def serve_forever(self):
+        """Run the commands sent to the socket until interrupted."""
+        import signal
+
+        # clean up when terminated
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        self.reload_config()
+        self.warm_up()
+        sock = self._bind()
+        inode = os.stat(self.path).st_ino
+        try:
+            while True:
+                conn, _ = sock.accept()
+                try:
+                    self._handle(conn)
+                except OSError as exc:
+                    # the client went away
+                    logging.info('connection failed: %s', exc)
+        finally:
+            sock.close()
+            with contextlib.suppress(OSError):
+                # keep the socket of another daemon started since
+                if os.stat(self.path).st_ino == inode:
+                    os.unlink(self.path)
@@ -0,0 +1,123 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Detect duplicate references."""
+
+import enum
+import hashlib
+import re
+import unicodedata
+
+# bibtex is imported by the functions using it, so the CLI can import this
+# module for the choices of --duplicates without importing bibtex.
+
+
+class Policy(enum.Enum):
+    """Possible ways to handle duplicates when importing."""
+    #: Import duplicates but warn about them.
+    REPORT = enum.auto()
+    #: Don't import duplicates.
+    SKIP = enum.auto()
+    #: Add the missing fields of a duplicate to the existing entry.
+    MERGE = enum.auto()
+    #: Don't look for duplicates.
+    OFF = enum.auto()
+
+
+_LATEX_COMMAND = re.compile(r'\\[a-zA-Z]+')
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def _normalize_text(text):
+    """Return `text` without LaTeX commands, accents, punctuation and
+    whitespace in lower case."""
+    text = _LATEX_COMMAND.sub('', text)
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return _NON_WORD.sub('', text).lower()
+
+
+def _first_author(entry):
+    """Return the last name of the first author of `entry`."""
+    authors = entry.get('author', '')
+    first = re.split(r'\s+and\s+', authors.strip(), maxsplit=1)[0]
+    if ',' in first:
+        return first.split(',')[0]
+    return first.split()[-1] if first.split() else ''
+
+
+def fingerprints(entry):
+    """Return the list of fingerprints of the BibTeX entry `entry`.
+
+    Two entries with a common fingerprint are considered duplicates.  The
+    fingerprints are the normalized DOI, the normalized eprint and a hash of
+    the normalized title, last name of the first author and year.
+    """
+    from . import bibtex
+
+    result = []
+    if entry.get('doi'):
+        result.append('doi:' + bibtex.canonical_doi(entry['doi']))
+    if entry.get('eprint'):
+        result.append('eprint:' + bibtex.canonical_eprint(entry['eprint']))
+    title = _normalize_text(entry.get('title', ''))
+    if title:
+        text = '\0'.join((title,
+                          _normalize_text(_first_author(entry)),
+                          entry.get('year', '').strip()))
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        result.append('title:' + digest)
+    return result
+
+
+class DuplicateIndex:
+    """Find duplicates of entries in the library and among the entries
+    added with `add`.
+
+    The library is queried through the fingerprints stored in the catalog
+    `lib_catalog`, so every lookup takes constant time.  `policy` is the
+    `Policy` to apply to the duplicates found.
+    """
+
+    def __init__(self, lib_catalog, policy=Policy.REPORT):
+        self.catalog = lib_catalog
+        self.policy = policy
+        self._added = {}
+
+    def find(self, entry):
+        """Return a duplicate of `entry` or `None` if there is none.
+
+        The duplicate is either an entry added with `add` or a tuple
+        `(key, path)` of an entry in the library.
+        """
+        entry_fingerprints = fingerprints(entry)
+        for fingerprint in entry_fingerprints:
+            if fingerprint in self._added:
+                return self._added[fingerprint]
+        return self.catalog.find_fingerprints(entry_fingerprints)
+
+    def add(self, entry):
+        """Add `entry` to the entries searched by `find`.
+
+        This is needed for entries which are not written to the library
+        (and hence not to the catalog) before the next entry is checked.
+        """
+        for fingerprint in fingerprints(entry):
+            self._added.setdefault(fingerprint, entry)
+
+    def clear(self):
+        """Forget the entries added with `add`."""
+        self._added.clear()
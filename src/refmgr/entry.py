@@ -0,0 +1,169 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""A compact representation of BibTeX entries."""
+
+from collections.abc import MutableMapping
+import sys
+
+
+#: Fields whose values are shared between entries because they repeat
+#: often.
+SHARED_FIELDS = frozenset([
+    'ENTRYTYPE', 'journal', 'shortjournal', 'month', 'year', 'publisher',
+    'booktitle', 'series', 'address', 'organization', 'school',
+    'institution', 'eprinttype', 'eprintclass', 'archiveprefix',
+    'primaryclass', 'language', 'type',
+    ])
+
+
+class _Schema:
+    """The ordered field names of entries.
+
+    Schemas are shared by all entries with the same fields, so the field
+    names and their index are stored only once.  The schemas reached by
+    adding or removing a field are cached.
+    """
+
+    __slots__ = ('fields', 'index', '_added', '_removed')
+
+    _schemas = {}
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.index = {field: i for i, field in enumerate(fields)}
+        self._added = {}
+        self._removed = {}
+
+    @classmethod
+    def get(cls, fields):
+        """Return the schema with the tuple of field names `fields`."""
+        schema = cls._schemas.get(fields)
+        if schema is None:
+            fields = tuple(sys.intern(field) for field in fields)
+            schema = cls._schemas.setdefault(fields, cls(fields))
+        return schema
+
+    def add(self, field):
+        """Return the schema with `field` appended."""
+        schema = self._added.get(field)
+        if schema is None:
+            schema = self._added[field] = self.get(self.fields + (field,))
+        return schema
+
+    def remove(self, field):
+        """Return the schema without `field`."""
+        schema = self._removed.get(field)
+        if schema is None:
+            fields = tuple(f for f in self.fields if f != field)
+            schema = self._removed[field] = self.get(fields)
+        return schema
+
+
+def _share(field, value):
+    """Return the shared copy of `value` if `field` is in
+    `SHARED_FIELDS`."""
+    if field in SHARED_FIELDS and type(value) is str:
+        return sys.intern(value)
+    return value
+
+
+def _make_entry(fields, values):
+    """Return a new `Entry`; used for unpickling."""
+    return Entry._from_schema(_Schema.get(fields), list(values))
+
+
+class Entry(MutableMapping):
+    """A BibTeX entry behaving like a dict.
+
+    The field names are stored once per set of fields in a shared schema
+    and the values of the fields in `SHARED_FIELDS` are interned, so an
+    entry only needs memory for the list of its values.  The order of the
+    fields is kept like in a dict.
+    """
+
+    __slots__ = ('_schema', '_values')
+
+    def __init__(self, *args, **kwargs):
+        self._schema = _Schema.get(())
+        self._values = []
+        if args or kwargs:
+            self.update(*args, **kwargs)
+
+    @classmethod
+    def _from_schema(cls, schema, values):
+        entry = cls.__new__(cls)
+        entry._schema = schema
+        entry._values = values
+        return entry
+
+    @classmethod
+    def from_mapping(cls, record):
+        """Return `record` as an `Entry`.
+
+        `record` is returned unchanged if it is an `Entry` already.
+        """
+        if isinstance(record, cls):
+            return record
+        items = list(record.items())
+        return cls._from_schema(
+            _Schema.get(tuple(field for field, _ in items)),
+            [_share(field, value) for field, value in items])
+
+    def __getitem__(self, field):
+        try:
+            return self._values[self._schema.index[field]]
+        except KeyError:
+            raise KeyError(field) from None
+
+    def __setitem__(self, field, value):
+        value = _share(field, value)
+        i = self._schema.index.get(field)
+        if i is None:
+            self._schema = self._schema.add(field)
+            self._values.append(value)
+        else:
+            self._values[i] = value
+
+    def __delitem__(self, field):
+        i = self._schema.index.get(field)
+        if i is None:
+            raise KeyError(field)
+        self._schema = self._schema.remove(field)
+        del self._values[i]
+
+    def __contains__(self, field):
+        return field in self._schema.index
+
+    def __iter__(self):
+        return iter(self._schema.fields)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __reduce__(self):
+        return _make_entry, (self._schema.fields, self._values)
+
+    def get(self, field, default=None):
+        i = self._schema.index.get(field)
+        return default if i is None else self._values[i]
+
+    def copy(self):
+        """Return a shallow copy of the entry."""
+        return self._from_schema(self._schema, list(self._values))
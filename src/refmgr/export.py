@@ -0,0 +1,238 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Export entries of the library into a single BibTeX file."""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import warnings
+
+from bibtexparser.bibdatabase import BibDatabase
+
+from . import conf
+from . import bibtex
+
+
+#: Config options of the section `bibtex` used by `bibtex.init_writer`.
+WRITER_OPTIONS = ('add_trailing_comma', 'comma_first', 'contents',
+                  'display_order', 'num_indent', 'order_entries_by',
+                  'write_common_strings')
+
+
+def writer_signature():
+    """Return a signature of the config options affecting the rendered
+    entries."""
+    options = {option: conf.get('bibtex', option, fallback=None)
+               for option in WRITER_OPTIONS}
+    return hashlib.sha1(
+        json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _sort_key(entry, fields):
+    """Return the key of `entry` for sorting by `fields` as bytes.
+
+    The bytes compare like the tuples of `BibDatabase.entry_sort_key`, so
+    SQLite can sort the entries.
+    """
+    return b'\0'.join(value.encode('utf-8')
+                      for value in BibDatabase.entry_sort_key(entry, fields))
+
+
+class RenderCache:
+    """A persistent cache of the rendered entries of the library files.
+
+    The cache is stored in an SQLite database at `path`.  For every library
+    file, the modification time and size are stored together with its
+    @string definitions and the text of its entries as rendered by
+    `bibtex.init_writer`, so only changed files are parsed and rendered
+    again.  The cache is cleared if the config options of the writer change.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._bwriter = bibtex.init_writer()
+
+        logging.debug('opening render cache %s', path)
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA foreign_keys=ON')
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS meta ('
+                'signature TEXT NOT NULL)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS files ('
+                'path TEXT PRIMARY KEY, '
+                'mtime INTEGER NOT NULL, '
+                'size INTEGER NOT NULL)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'path TEXT NOT NULL '
+                'REFERENCES files(path) ON DELETE CASCADE, '
+                'position INTEGER NOT NULL, '
+                'key TEXT NOT NULL, '
+                'sortkey BLOB NOT NULL, '
+                'text TEXT NOT NULL)')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS entries_path ON entries(path)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS strings ('
+                'path TEXT NOT NULL '
+                'REFERENCES files(path) ON DELETE CASCADE, '
+                'position INTEGER NOT NULL, '
+                'name TEXT NOT NULL, '
+                'value TEXT NOT NULL)')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS strings_path ON strings(path)')
+
+            signature = writer_signature()
+            row = self._conn.execute('SELECT signature FROM meta').fetchone()
+            if row is None or row[0] != signature:
+                logging.debug('clearing render cache %s: writer changed',
+                              path)
+                self._conn.execute('DELETE FROM files')
+                self._conn.execute('DELETE FROM meta')
+                self._conn.execute('INSERT INTO meta VALUES (?)',
+                                   (signature,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the underlying database."""
+        self._conn.close()
+
+    def _render(self, path, stat):
+        """Parse and render the library file at `path` without
+        committing."""
+        db = bibtex.parse_library_file(path)
+        fields = self._bwriter.order_entries_by or ()
+
+        # a database with a single entry and nothing else renders the entry
+        single = BibDatabase()
+        rows = []
+        for position, entry in enumerate(db.entries):
+            single.entries = [entry]
+            rows.append((path, position, entry['ID'],
+                         _sort_key(entry, fields),
+                         self._bwriter.write(single)))
+
+        self._conn.execute('DELETE FROM files WHERE path=?', (path,))
+        self._conn.execute('INSERT INTO files VALUES (?, ?, ?)',
+                           (path, stat.st_mtime_ns, stat.st_size))
+        self._conn.executemany(
+            'INSERT INTO entries VALUES (?, ?, ?, ?, ?)', rows)
+        self._conn.executemany(
+            'INSERT INTO strings VALUES (?, ?, ?, ?)',
+            [(path, position, name, str(value))
+             for position, (name, value) in enumerate(db.strings.items())])
+
+    def refresh(self, paths):
+        """Render the files of the iterable `paths` which are new or changed
+        and forget the files which are not in `paths`.
+
+        Returns the number of rendered files.
+        """
+        known = {path: (mtime, size) for path, mtime, size
+                 in self._conn.execute('SELECT path, mtime, size FROM files')}
+        rendered = 0
+        with self._conn:
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if known.pop(path, None) == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                try:
+                    self._render(path, stat)
+                except Exception as exc:
+                    msg = f'skipping exporting {path}: {exc}'
+                    warnings.warn(msg, RuntimeWarning)
+                    self._conn.execute('DELETE FROM files WHERE path=?',
+                                       (path,))
+                    continue
+                rendered += 1
+            self._conn.executemany('DELETE FROM files WHERE path=?',
+                                   [(path,) for path in known])
+        return rendered
+
+    def _select(self, selection):
+        """Fill the temporary table `selected` with the tuples `(key, path)`
+        of `selection` or all cached entries if `selection` is `None`."""
+        self._conn.execute('CREATE TEMP TABLE IF NOT EXISTS selected ('
+                           'key TEXT NOT NULL, path TEXT NOT NULL)')
+        self._conn.execute('DELETE FROM selected')
+        if selection is None:
+            self._conn.execute('INSERT INTO selected '
+                               'SELECT key, path FROM entries')
+        else:
+            self._conn.executemany('INSERT INTO selected VALUES (?, ?)',
+                                   selection)
+
+    def export(self, outfile, selection=None):
+        """Write the selected entries and the @string definitions of their
+        files to the file object `outfile`.
+
+        `selection` is an iterable of tuples `(key, path)` of entries in the
+        library or `None` to export all entries.  The entries are streamed
+        from the cache in the order of the config option
+        `bibtex.order_entries_by`; call `refresh` first.  Returns the number
+        of written entries.
+        """
+        self._select(selection)
+
+        strings = {}
+        for name, value, path in self._conn.execute(
+                'SELECT name, value, path FROM strings '
+                'WHERE path IN (SELECT path FROM selected) '
+                'ORDER BY path, position'):
+            if strings.setdefault(name, value) != value:
+                msg = (f'skipping @string {name} of {path}: '
+                       'defined differently in another file')
+                warnings.warn(msg, RuntimeWarning)
+        db = BibDatabase()
+        db.strings.update(strings)
+        # renders the strings only since there are no entries
+        outfile.write(self._bwriter.write(db))
+
+        order = 'e.sortkey, ' if self._bwriter.order_entries_by else ''
+        cursor = self._conn.execute(
+            'SELECT DISTINCT e.key, e.path, e.position, e.sortkey, e.text '
+            'FROM entries AS e JOIN selected AS s '
+            'ON e.key=s.key AND e.path=s.path '
+            f'ORDER BY {order}e.path, e.position')
+        if 'entries' not in self._bwriter.contents:
+            return 0
+
+        seen = set()
+        for key, path, _, _, text in cursor:
+            if key in seen:
+                msg = f'skipping exporting {key} of {path}: duplicate key'
+                warnings.warn(msg, RuntimeWarning)
+                continue
+            if seen:
+                outfile.write(self._bwriter.entry_separator)
+            seen.add(key)
+            outfile.write(text)
+        return len(seen)
@@ -0,0 +1,75 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""BibTeX parsers sharing their grammar.
+
+Every `bibtexparser.bparser.BibTexParser` builds its own pyparsing grammar,
+which takes longer than parsing a small file.  The parsers of this module
+share a pool of grammars instead.  Every parse takes an idle grammar of
+the pool, whose parse actions are forwarded to the parser currently
+parsing, so parsers in several threads never use the same grammar at once.
+This module imports bibtexparser, so import it where it is needed.
+"""
+
+from bibtexparser.bparser import BibTexParser
+
+
+class _Grammar(BibTexParser):
+    """Owner of a grammar whose parse actions are forwarded to the parser
+    `target`."""
+
+    def __init__(self):
+        super().__init__(common_strings=False)
+        self.target = None
+
+    def _add_entry(self, *args):
+        return self.target._add_entry(*args)
+
+    def _add_comment(self, *args):
+        return self.target._add_comment(*args)
+
+    def _add_preamble(self, *args):
+        return self.target._add_preamble(*args)
+
+    def _add_string(self, *args):
+        return self.target._add_string(*args)
+
+
+# grammars which are not parsing; list.pop and list.append are atomic
+_idle = []
+
+
+class Parser(BibTexParser):
+    """A `BibTexParser` using an idle grammar of the pool."""
+
+    def _init_expressions(self):
+        # the grammar is set by parse
+        self._expr = None
+
+    def parse(self, bibtex_str, partial=False):
+        try:
+            grammar = _idle.pop()
+        except IndexError:
+            grammar = _Grammar()
+        # bib_database is read by the parse action of string names
+        grammar.target, grammar.bib_database = self, self.bib_database
+        self._expr = grammar._expr
+        try:
+            return super().parse(bibtex_str, partial)
+        finally:
+            self._expr = None
+            grammar.target, grammar.bib_database = None, None
+            _idle.append(grammar)
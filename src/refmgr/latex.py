@@ -0,0 +1,180 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Memoized conversions between LaTeX code and unicode.
+
+The customizations `convert_to_unicode` and `homogenize_latex_encoding` of
+bibtexparser convert every field of every entry.  Since values like journal
+names, publishers and authors repeat across a library, the conversions of
+field values are memoized in a bounded LRU cache shared by all entries.
+Values which the conversion would return unchanged are not converted at
+all.
+"""
+
+import contextlib
+import functools
+import re
+import unicodedata
+import warnings
+
+from . import conf
+from . import stats
+
+
+#: Default number of converted values kept in the cache.
+DEFAULT_CACHE_SIZE = 65536
+
+
+
+@functools.cache
+def _ascii_special_chars():
+    """Return the regular expression matching the ASCII characters which
+    `latex_to_unicode` or `string_to_latex` replace."""
+    from bibtexparser.latexenc import unicode_to_latex_map
+
+    # braces are removed by latex_to_unicode
+    chars = ''.join(char for char in unicode_to_latex_map
+                    if char.isascii() and char != ' ')
+    return re.compile(f'[{re.escape(chars)}]')
+
+
+def _to_unicode(value):
+    from bibtexparser.latexenc import latex_to_unicode
+    return latex_to_unicode(value)
+
+
+def _to_latex(value):
+    from bibtexparser.latexenc import latex_to_unicode, string_to_latex
+    return string_to_latex(latex_to_unicode(value))
+
+
+_CONVERSIONS = {'unicode': _to_unicode, 'latex': _to_latex}
+
+
+def _convert(conversion, value):
+    """Return `value` converted by the conversion named `conversion`."""
+    return _CONVERSIONS[conversion](value)
+
+
+_cached_convert = functools.lru_cache(DEFAULT_CACHE_SIZE)(_convert)
+
+
+def set_cache_size(size):
+    """Replace the cache by an empty one with at most `size` values."""
+    global _cached_convert
+    _cached_convert = functools.lru_cache(size)(_convert)
+
+
+def cache_size():
+    """Return the config option `bibtex.latex_cache_size`."""
+    return conf.getint('bibtex', 'latex_cache_size',
+                       fallback=DEFAULT_CACHE_SIZE)
+
+
+def configure():
+    """Resize the cache to the config option `bibtex.latex_cache_size` if
+    it changed."""
+    size = cache_size()
+    if _cached_convert.cache_info().maxsize != size:
+        set_cache_size(size)
+
+
+def cache_info():
+    """Return the `functools.lru_cache` statistics of the cache."""
+    return _cached_convert.cache_info()
+
+
+def to_unicode(value):
+    """Return the string `value` with LaTeX code converted to unicode like
+    `bibtexparser.latexenc.latex_to_unicode`."""
+    if '\\' not in value and '{' not in value and '}' not in value:
+        if stats.enabled:
+            stats.count('latex.skipped')
+        if value.isascii():
+            return value
+        return unicodedata.normalize('NFC', value)
+    return _cached_convert('unicode', value)
+
+
+def to_latex(value):
+    """Return the string `value` converted to LaTeX code like
+    `bibtexparser.latexenc.string_to_latex` applied after `to_unicode`."""
+    if value.isascii() and _ascii_special_chars().search(value) is None:
+        if stats.enabled:
+            stats.count('latex.skipped')
+        return value
+    return _cached_convert('latex', value)
+
+
+def _convert_value(value, function):
+    if isinstance(value, list):
+        return [function(x) for x in value]
+    if isinstance(value, dict):
+        return {k: function(v) for k, v in value.items()}
+    return function(value)
+
+
+class _CountHits:
+    """Context manager adding the hits and misses of the cache during its
+    block to the counters `latex.hits` and `latex.misses`."""
+
+    def __enter__(self):
+        self._info = cache_info()
+
+    def __exit__(self, *exc_info):
+        info = cache_info()
+        stats.count('latex.hits', info.hits - self._info.hits)
+        stats.count('latex.misses', info.misses - self._info.misses)
+
+
+def _count_hits():
+    """Return a `_CountHits` if statistics are collected."""
+    return _CountHits() if stats.enabled else contextlib.nullcontext()
+
+
+def convert_to_unicode(record):
+    """Convert the LaTeX code of all fields of `record` to unicode.
+
+    Like `bibtexparser.customization.convert_to_unicode` but memoized.
+    """
+    with _count_hits():
+        for field, value in record.items():
+            record[field] = _convert_value(value, to_unicode)
+    return record
+
+
+def homogenize_latex_encoding(record):
+    """Homogenize the LaTeX code of all fields of `record`.
+
+    Like `bibtexparser.customization.homogenize_latex_encoding` but
+    memoized.
+    """
+    from bibtexparser.latexenc import protect_uppercase
+
+    with _count_hits():
+        for field, value in record.items():
+            if field == 'ID':
+                record[field] = _convert_value(value, to_unicode)
+            elif isinstance(value, (list, str)):
+                record[field] = _convert_value(value, to_latex)
+            else:
+                record[field] = _convert_value(value, to_unicode)
+                msg = (f'Unable to homogenize latex encoding for {field}: '
+                       'Expected string or list,')
+                warnings.warn(msg, RuntimeWarning)
+            if field == 'title':
+                record[field] = protect_uppercase(record[field])
+    return record
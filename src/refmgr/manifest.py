@@ -0,0 +1,133 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Remember imported files to skip them when they are unchanged."""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+
+def file_digest(path):
+    """Return the SHA-256 hex digest of the content of the file at
+    `path`."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        # hashlib.file_digest needs Python 3.11
+        while chunk := infile.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """A persistent manifest of the imported files.
+
+    The manifest is stored in an SQLite database at `path`.  For every
+    imported file, the size, modification time and content hash are stored
+    together with a signature of the import options and the paths of the
+    library files produced by the import.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._states = {}
+
+        logging.debug('opening manifest %s', path)
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS sources ('
+                'path TEXT PRIMARY KEY, '
+                'size INTEGER NOT NULL, '
+                'mtime INTEGER NOT NULL, '
+                'digest TEXT NOT NULL, '
+                'options TEXT NOT NULL, '
+                'outputs TEXT NOT NULL, '
+                'imported REAL NOT NULL)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the underlying database."""
+        self._conn.close()
+
+    def unchanged(self, source, options):
+        """Return whether the file at `source` was imported with the options
+        signature `options` and neither it nor its outputs changed since.
+
+        The content hash is only computed if the file has to be imported or
+        its modification time changed.  Returns `False` if the file cannot
+        be read, so the import reports the error.
+        """
+        source = os.path.realpath(source)
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return False
+
+        row = self._conn.execute(
+            'SELECT size, mtime, digest, options, outputs FROM sources '
+            'WHERE path=?', (source,)).fetchone()
+        known = (row is not None and row[3] == options
+                 and all(os.path.exists(output)
+                         for output in json.loads(row[4])))
+        if known and row[:2] == (stat.st_size, stat.st_mtime_ns):
+            return True
+
+        # hash the file before importing it, so changes during the import
+        # are detected next time
+        try:
+            digest = file_digest(source)
+        except OSError:
+            return False
+        self._states[source] = (stat.st_size, stat.st_mtime_ns, digest)
+        if not known or row[2] != digest:
+            return False
+
+        # touched but not modified
+        with self._conn:
+            self._conn.execute('UPDATE sources SET mtime=? WHERE path=?',
+                               (stat.st_mtime_ns, source))
+        return True
+
+    def record(self, source, options, outputs):
+        """Record that the file at `source` was imported with the options
+        signature `options`, producing the library files `outputs`.
+
+        The state of the file determined by `unchanged` is stored, so a
+        change of the file during the import is detected next time.
+        """
+        source = os.path.realpath(source)
+        state = self._states.pop(source, None)
+        if state is None:
+            stat = os.stat(source)
+            state = (stat.st_size, stat.st_mtime_ns, file_digest(source))
+        size, mtime, digest = state
+
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (source, size, mtime, digest, options,
+                 json.dumps(sorted(outputs)), time.time()))
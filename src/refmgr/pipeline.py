@@ -0,0 +1,146 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Run the stages of an import concurrently.
+
+`prefetch` runs a stage, e.g., parsing or completing entries, in a thread
+ahead of the stage consuming its items.  The stages are connected by
+bounded queues, so a stage blocks when it gets too far ahead.  Warnings
+issued by a stage are held back and issued again when the consumer reaches
+the item, and errors are raised at the position of the item, so the output
+is the same as when running the stages one after another.
+"""
+
+import contextlib
+import queue
+import threading
+import warnings
+
+
+_local = threading.local()
+_hook_lock = threading.Lock()
+_hook_users = 0
+_previous_showwarning = None
+
+
+def _showwarning(message, category, filename, lineno, file=None,
+                 line=None):
+    """Hold back the warning if the current thread is a stage of a
+    pipeline and show it otherwise."""
+    caught = getattr(_local, 'caught', None)
+    if caught is None:
+        _previous_showwarning(message, category, filename, lineno, file,
+                              line)
+    else:
+        caught.append((message, category, filename, lineno, file, line))
+
+
+@contextlib.contextmanager
+def _hold_warnings():
+    """Install `_showwarning` while the block runs."""
+    global _hook_users, _previous_showwarning
+    with _hook_lock:
+        if not _hook_users:
+            _previous_showwarning = warnings.showwarning
+            warnings.showwarning = _showwarning
+        _hook_users += 1
+    try:
+        yield
+    finally:
+        with _hook_lock:
+            _hook_users -= 1
+            if not _hook_users:
+                if warnings.showwarning is _showwarning:
+                    warnings.showwarning = _previous_showwarning
+                _previous_showwarning = None
+
+
+def _reissue(caught):
+    """Show the held back warnings `caught`, or hold them back again if the
+    current thread is a stage itself."""
+    for args in caught:
+        _showwarning(*args)
+
+
+_ITEM = 'item'
+_ERROR = 'error'
+_END = 'end'
+
+
+def _produce(iterator, items, stop):
+    """Put the items of `iterator` into the queue `items` until `stop` is
+    set.
+
+    Every item is put as a tuple `(kind, value, caught)` with the warnings
+    `caught` while producing it.
+    """
+    try:
+        while not stop.is_set():
+            _local.caught = []
+            try:
+                value = next(iterator)
+            except StopIteration:
+                items.put((_END, None, _local.caught))
+                return
+            except BaseException as exc:
+                items.put((_ERROR, exc, _local.caught))
+                return
+            items.put((_ITEM, value, _local.caught))
+    finally:
+        # warnings while cleaning up are shown right away
+        _local.caught = None
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
+
+
+def prefetch(iterable, size=2):
+    """Yield the items of `iterable`, which are produced by a thread at most
+    `size` items ahead.
+
+    Warnings issued while producing an item are issued again before the
+    item is yielded, and an exception raised by `iterable` is raised when
+    its position is reached.  If `iterable` is a generator, it runs in the
+    thread and is closed there when this generator is closed.  If `size` is
+    0, `iterable` is iterated directly.
+    """
+    if size <= 0:
+        yield from iterable
+        return
+
+    items = queue.Queue(size)
+    stop = threading.Event()
+    thread = threading.Thread(target=_produce,
+                              args=(iter(iterable), items, stop),
+                              name='refmgr-prefetch', daemon=True)
+    with _hold_warnings():
+        thread.start()
+        try:
+            while True:
+                kind, value, caught = items.get()
+                _reissue(caught)
+                if kind == _END:
+                    return
+                if kind == _ERROR:
+                    raise value
+                yield value
+        finally:
+            stop.set()
+            # unblock the thread if it waits for a free slot
+            while thread.is_alive():
+                with contextlib.suppress(queue.Empty):
+                    items.get(timeout=0.05)
+            thread.join()
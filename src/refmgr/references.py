@@ -16,16 +16,32 @@
 
 """Import references."""
 
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import hashlib
+import itertools
+import json
 import logging
 import os.path
 import warnings
-import shutil
+import string
+import sys
 
 from bibtexparser.bibdatabase import BibDatabase
 
+from . import attachments
 from . import conf
 from . import bibtex
+from . import cache
+from . import catalog
 from . import complete
+from . import duplicates
+from . import export
+from . import manifest
+from . import pipeline
+from . import stats
+from . import watch
+from . import writer
 
 
 def library_path():
@@ -35,10 +51,186 @@ def library_path():
             os.path.expanduser(
                 conf['library']['path'])))
 
+def data_path(name):
+    """Return the path of the file `name` in the data directory of refmgr
+    inside the library.
+
+    The data directory is created if it doesn't exist.
+    """
+    dirname = os.path.join(library_path(), '.refmgr')
+    os.makedirs(dirname, exist_ok=True)
+    return os.path.join(dirname, name)
+
+
+def open_completion_cache(completions):
+    """Return the completion cache of the library or `None` if there are no
+    `completions` or the cache is disabled."""
+    if not completions or not conf.getboolean('cache', 'enabled',
+                                              fallback=True):
+        return None
+    return cache.CompletionCache.from_config(data_path('completions.sqlite'))
+
+
+_catalogs = {}
+
+
+def library_catalog():
+    """Return the catalog of the library.
+
+    The catalog is opened once per library path and kept open.
+    """
+    path = data_path('catalog.sqlite')
+    if path not in _catalogs:
+        _catalogs[path] = catalog.Catalog(path)
+    return _catalogs[path]
+
+
+def index_library(args):
+    """Update the catalog of the library.
+
+    With `args.rebuild`, the catalog is rebuilt from scratch.
+    """
+    lib_catalog = library_catalog()
+    if args.rebuild:
+        lib_catalog.clear()
+    counts = lib_catalog.update(library_path(), args.jobs)
+    print(', '.join(f'{value} {key}' for key, value in counts.items()))
+
+
+def lookup_refs(args):
+    """Print the entries of the library matching the given criteria."""
+    lib_catalog = library_catalog()
+    if args.query is not None:
+        rows = lib_catalog.search(args.query)
+    else:
+        rows = lib_catalog.lookup(args.key, args.doi, args.eprint,
+                                  args.author)
+
+    for key, doi, eprint, title, path in rows:
+        print(f'{key}\t{path}')
+
+
+def search_refs(args):
+    """Print the entries of the library best matching the full-text search
+    `args.query`."""
+    query = ' '.join(args.query)
+    for key, doi, eprint, title, path in library_catalog().search_text(
+            query, args.limit):
+        print(f'{key}\t{path}')
+
+
+def export_refs(args):
+    """Export entries of the library into a single BibTeX file.
+
+    The entries whose key, DOI or eprint is in `args.refs` are written to
+    `args.output` (default: stdout); all entries if `args.refs` is empty.
+    """
+    lib_catalog = library_catalog()
+    lib_catalog.update(library_path())
+
+    selection = None
+    if args.refs:
+        selection = []
+        for ref in args.refs:
+            rows = lib_catalog.search(ref)
+            if not rows:
+                warnings.warn(f'skipping exporting {ref}: not found',
+                              RuntimeWarning)
+            selection.extend((key, path) for key, *_, path in rows)
+
+    with export.RenderCache(data_path('export.sqlite')) as render_cache:
+        render_cache.refresh(lib_catalog.paths())
+        if args.output is None:
+            count = render_cache.export(sys.stdout, selection)
+        else:
+            with open(args.output, 'w') as outfile:
+                count = render_cache.export(outfile, selection)
+    logging.info('exported %s entries', count)
+
+
+def open_duplicate_index(policy=None):
+    """Return a `duplicates.DuplicateIndex` of the library applying the
+    duplicates policy `policy` (a string).
+
+    If `policy` is `None`, the config option `import.duplicates` is used
+    (default: 'report').  Returns `None` if the policy is 'off'.
+    """
+    if policy is None:
+        policy = conf.get('import', 'duplicates', fallback='report')
+    policy = duplicates.Policy[policy.upper()]
+    if policy is duplicates.Policy.OFF:
+        return None
+    return duplicates.DuplicateIndex(library_catalog(), policy)
+
+
+def options_signature(single=False, completions=None, copy=None,
+                      rename=False, duplicate_index=None):
+    """Return a signature of the import options and the config options
+    affecting the imported entries.
+
+    See `import_bib` for the meaning of the arguments.
+    """
+    options = {
+        'single': bool(single),
+        'completions': sorted(completions or []),
+        'copy': sorted(copy or []),
+        'rename': bool(rename),
+        'duplicates': (None if duplicate_index is None
+                       else duplicate_index.policy.name),
+        'bibtex': (dict(conf.items('bibtex', raw=True))
+                   if conf.has_section('bibtex') else {}),
+        }
+    return hashlib.sha1(
+        json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()
+
+
 def import_refs(args):
-    """Import the given references."""
-    for ref in args.refs:
-        import_bib(ref, args.single, args.complete, args.copy, args.rename)
+    """Import the given references.
+
+    Files which were imported with the same options before and didn't change
+    since are skipped unless `args.force` is true.
+    """
+    # the library may have changed since the last import
+    _file_names.clear()
+    duplicate_index = open_duplicate_index(args.duplicates)
+    options = options_signature(args.single, args.complete, args.copy,
+                                args.rename, duplicate_index)
+
+    with manifest.Manifest(data_path('manifest.sqlite')) as lib_manifest, \
+            attachments.AttachmentCopier.from_config(args.copy_mode) as copier:
+        refs = []
+        for ref in args.refs:
+            if not args.force and lib_manifest.unchanged(ref, options):
+                logging.info('skipping importing %s: unchanged', ref)
+            else:
+                refs.append(ref)
+
+        if args.jobs > 1:
+            import_bibs_parallel(refs, args.jobs, args.single, args.complete,
+                                 args.copy, args.rename, duplicate_index,
+                                 lib_manifest, options, copier)
+            return
+
+        import_bibs(refs, args.single, args.complete, args.copy,
+                    args.rename, duplicate_index, lib_manifest, options,
+                    copier)
+
+
+def watch_refs(args):
+    """Import the BibTeX files in the directory `args.dir` and the new or
+    changed files arriving there.
+
+    The files are imported with `import_refs` using the other options of
+    `args`; see `watch.watch` for the watching.
+    """
+    def import_paths(paths):
+        args.refs = paths
+        import_refs(args)
+
+    watch.watch(args.dir, import_paths,
+                settle=conf.getfloat('watch', 'settle', fallback=0.25),
+                poll_interval=conf.getfloat('watch', 'poll_interval',
+                                            fallback=0.5))
 
 
 def new_bib_path(path):
@@ -48,72 +240,325 @@ def new_bib_path(path):
     return os.path.join(dirname, basename)
 
 
-def single_bib_path(entry):
-    """Return the path of a BibTeX file with a single entry."""
-    print(f'{entry = }, {type(entry) = }')
-    basename = entry['ID']
-    dirname = library_path()
-    return os.path.join(dirname, f'{basename}.bib')
+def _suffix(i):
+    """Return the `i`-th suffix of the sequence 'a', ..., 'z', 'aa', 'ab',
+    ..."""
+    suffix = ''
+    i += 1
+    while i:
+        i, remainder = divmod(i - 1, 26)
+        suffix = string.ascii_lowercase[remainder] + suffix
+    return suffix
 
 
-def subs_ext(path, ext):
-    """Substitute the extension of `path` with `ext` and return the new
-    path."""
-    root, _ = os.path.splitext(path)
-    ext = ext.rstrip('.')
-    return f'{root}.{ext}'
+class FileNames:
+    """Assign unique names to the files of the library.
 
+    `names` are the names in use.  Names are compared case-insensitively,
+    so they are unique on case-insensitive file systems, too.
+    """
 
-def write_database(db, outpath, overwrite=False):
-    """Write the BibDatabase `db` to the path `outpath`."""
-    bwriter = bibtex.init_writer()
-    mode = 'w' if overwrite else 'x'
+    def __init__(self, names=()):
+        self._used = {name.casefold(): name for name in names}
+        # fingerprint -> names assigned to entries with the fingerprint
+        self._owners = {}
+        self._next = {}
+
+    @classmethod
+    def from_directory(cls, dirname):
+        """Return the `FileNames` with the names of the BibTeX files in the
+        directory `dirname` (without extension) in use."""
+        with os.scandir(dirname) as it:
+            return cls(dir_entry.name[:-len('.bib')] for dir_entry in it
+                       if dir_entry.name.endswith('.bib'))
+
+    def used(self, name):
+        """Return the name in use equal to `name` ignoring case or `None`
+        if `name` is unused."""
+        return self._used.get(name.casefold())
+
+    def find(self, name, fingerprints):
+        """Return a name assigned by `assign` to an entry with one of the
+        `fingerprints` which is `name` or `name` with a suffix (see
+        `in_family`) or `None` if there is none."""
+        for fingerprint in fingerprints:
+            for owner in self._owners.get(fingerprint, ()):
+                if in_family(owner, name):
+                    return owner
+        return None
+
+    def assign(self, name, fingerprints=()):
+        """Return `name` if it's unused and `name` with the first unused
+        suffix 'a', 'b', ... otherwise and mark it as used by an entry with
+        the `fingerprints`."""
+        candidate = name
+        if candidate.casefold() in self._used:
+            i = self._next.get(name, 0)
+            while (candidate := name + _suffix(i)).casefold() in self._used:
+                i += 1
+            self._next[name] = i + 1
+        self._used[candidate.casefold()] = candidate
+        for fingerprint in fingerprints:
+            self._owners.setdefault(fingerprint, []).append(candidate)
+        return candidate
+
+
+def in_family(stem, name):
+    """Return whether the file name `stem` is `name` or `name` with a suffix
+    'a', 'b', ... ignoring case."""
+    stem, name = stem.casefold(), name.casefold()
+    suffix = stem[len(name):]
+    return stem.startswith(name) and (
+        not suffix or suffix.isascii() and suffix.isalpha())
+
+
+_file_names = {}
+
+
+def library_file_names():
+    """Return the `FileNames` of the library.
+
+    The names are read from the library once and kept until
+    `import_refs` is called again.
+    """
+    dirname = library_path()
+    if dirname not in _file_names:
+        _file_names[dirname] = FileNames.from_directory(dirname)
+    return _file_names[dirname]
+
+
+def _find_library_file(name, fingerprints):
+    """Return the path of a file of the library named `name` or `name` with
+    a suffix holding an entry with one of the `fingerprints` or `None` if
+    there is none.
 
+    The files are looked up in the catalog.  The file named `name` is read
+    if it isn't in the catalog.
+    """
+    dirname = library_path()
+    lib_catalog = library_catalog()
+    for path in lib_catalog.fingerprint_paths(fingerprints):
+        stem, ext = os.path.splitext(os.path.basename(path))
+        if (os.path.dirname(path) == dirname and ext == '.bib'
+                and in_family(stem, name)):
+            return path
+
+    used = library_file_names().used(name)
+    if used is None:
+        return None
+    path = os.path.join(dirname, f'{used}.bib')
+    if lib_catalog.file_fingerprints(path) is not None:
+        return None
     try:
-        if os.path.exists(outpath):
-            msg = f'overwriting {outpath}'
-            logging.info(msg)
-        with open(outpath, mode) as outfile:
-            msg = f'writing to {outpath}'
-            logging.info(msg)
-            outfile.write(bwriter.write(db))
-    except FileExistsError:
-        msg = f"skipping writing to {outpath}: file already exists"
-        warnings.warn(msg, RuntimeWarning)
-
-
-def import_bib(path, single=False, completions=None, copy=None, rename=False):
-    """Import the bibtex file at the given path.
+        db = bibtex.parse_library_file(path)
+    except OSError as exc:
+        logging.info('reading %s failed: %s', path, exc)
+        return None
+    if any(fingerprint in fingerprints for entry in db.entries
+           for fingerprint in duplicates.fingerprints(entry)):
+        return path
+    return None
 
-    If `single` is `False`, the every import file is saved in the library.
-    If it is `True`, a new file will be created for every BibTeX entry
-    in the library; it's name will be the BibTeX key with the suffix '.bib'.
+
+def single_bib_path(entry):
+    """Return the path of a new BibTeX file with the single entry `entry`.
+
+    The name of the file is the key of the entry.  If there is a file with
+    this name holding another entry, a suffix 'a', 'b', ... is appended to
+    the key of the entry and the name of the file.  If the file, or a file
+    with the name and a suffix, holds the same entry (see
+    `duplicates.fingerprints`), e.g., because a file is imported again, its
+    path is returned, so the entry isn't written twice.
     """
+    names = library_file_names()
+    fingerprints = set(duplicates.fingerprints(entry))
+    used = names.find(entry['ID'], fingerprints)
+    if used is not None:
+        return os.path.join(library_path(), f'{used}.bib')
+    path = _find_library_file(entry['ID'], fingerprints)
+    if path is not None:
+        return path
+
+    key = names.assign(entry['ID'], fingerprints)
+    if key != entry['ID']:
+        logging.info('renaming %s to %s: file exists', entry['ID'], key)
+        entry['ID'] = key
+    return os.path.join(library_path(), f'{key}.bib')
+
+
+def open_library_writer():
+    """Return a `writer.LibraryWriter` for the library configured by the
+    config section `library`."""
+    return writer.LibraryWriter.from_config(library_catalog())
+
+
+def write_database(db, outpath, overwrite=False):
+    """Write the BibDatabase `db` to the path `outpath`.
+
+    Returns the list of written paths, which is empty if the file exists and
+    `overwrite` is `False`.
+    """
+    with open_library_writer() as lib_writer:
+        lib_writer.write(db, outpath, overwrite)
+    return lib_writer.written
+
+
+def _completions(completions):
+    """Convert the sequence of strings `completions` to a list of
+    `complete.Completion` instances."""
     if completions is None:
-        completions = []
-    if copy is None:
-        copy = []
+        return []
+    return [complete.Completion[c.upper()] for c in completions]
 
-    # convert strings to complete.Completion
-    completions = [complete.Completion[c.upper()] for c in completions]
 
-    bparser = bibtex.init_parser()
+def read_bib(path, completions=None):
+    """Read the BibTeX file at `path` and return it as a BibDatabase.
 
-    with open(path, 'r') as infile:
+    The entries are customized while parsing and completed with the given
+    `completions` (a sequence of strings) afterwards.
+    """
+    completions = _completions(completions)
+
+    # the whole file is kept in memory
+    bparser = bibtex.init_parser(compact=True)
+
+    with open(path, 'r') as infile, stats.timer('parse'):
         db = bparser.parse_file(infile)
+    stats.count('import.entries', len(db.entries))
+
+    completion_cache = open_completion_cache(completions)
+    try:
+        with stats.timer('complete'):
+            db.entries = complete.complete_many(db.entries, completions,
+                                                completion_cache)
+    finally:
+        if completion_cache is not None:
+            completion_cache.close()
+
+    return db
+
+
+def merge_entry(duplicate, entry):
+    """Add the fields of `entry` missing in `duplicate`.
+
+    `duplicate` is a duplicate as returned by
+    `duplicates.DuplicateIndex.find`, i.e., either an entry or a tuple
+    `(key, path)` of an entry in the library, which is rewritten.
+    """
+    if not isinstance(duplicate, tuple):
+        for field, value in entry.items():
+            duplicate.setdefault(field, value)
+        return
+
+    key, path = duplicate
+    db = bibtex.parse_library_file(path)
+    for existing in db.entries:
+        if existing['ID'] == key:
+            missing = [field for field in entry if field not in existing]
+            if not missing:
+                return
+            logging.info('merging %s of %s into %s', missing, entry['ID'],
+                         path)
+            for field in missing:
+                existing[field] = entry[field]
+            write_database(db, path, overwrite=True)
+            return
+
+
+def filter_duplicates(entries, duplicate_index, pending=False):
+    """Yield the entries of the iterable `entries` which should be imported
+    according to the policy of `duplicate_index`.
+
+    If `pending` is `True`, the yielded entries are added to
+    `duplicate_index`, which is necessary if they are not written to the
+    library before the next entry is checked.
+    """
+    if duplicate_index is None:
+        yield from entries
+        return
+
+    policy = duplicate_index.policy
+    for entry in entries:
+        with stats.timer('duplicates'):
+            duplicate = duplicate_index.find(entry)
+        if duplicate is None:
+            if pending:
+                duplicate_index.add(entry)
+            yield entry
+            continue
+
+        if isinstance(duplicate, tuple):
+            other = '{} in {}'.format(*duplicate)
+        else:
+            other = duplicate['ID']
+
+        match policy:
+            case duplicates.Policy.SKIP:
+                msg = (f"skipping importing {entry['ID']}: "
+                       f"duplicate of {other}")
+                warnings.warn(msg, RuntimeWarning)
+            case duplicates.Policy.MERGE:
+                logging.info('merging duplicate %s into %s',
+                             entry['ID'], other)
+                merge_entry(duplicate, entry)
+            case _:
+                msg = f"{entry['ID']} is a duplicate of {other}"
+                warnings.warn(msg, RuntimeWarning)
+                if pending:
+                    duplicate_index.add(entry)
+                yield entry
+
 
-    db.entries = [complete.complete(e, completions) for e in db.entries]
+def write_entries(entries, strings, duplicate_index=None):
+    """Write every entry of the iterable `entries` to its own file in the
+    library.
+
+    The BibTeX strings `strings` are written to every file.  The files are
+    written in batches; `duplicate_index` is cleared after every batch since
+    the written entries are found in the catalog from then on.  Returns the
+    list of written paths.
+    """
+    db = BibDatabase()
+    db.strings = strings
+    with open_library_writer() as lib_writer:
+        for entry in entries:
+            db.entries = [entry]
+            lib_writer.write(db, single_bib_path(entry))
+            if lib_writer.full:
+                lib_writer.flush()
+                if duplicate_index is not None:
+                    duplicate_index.clear()
+    if duplicate_index is not None:
+        duplicate_index.clear()
+    return lib_writer.written
+
+
+def write_bib(path, db, single=False, copy=None, rename=False,
+              duplicate_index=None, copier=None):
+    """Write the BibDatabase `db` read from `path` into the library.
+
+    See `import_bib` for the meaning of the arguments and the return value.
+    """
+    if copy is None:
+        copy = []
 
     if single:
-        db2 = BibDatabase()
-        db2.strings = db.strings
-        for entry in db.entries:
-            db2.entries = [entry]
-            outpath = single_bib_path(entry)
-            write_database(db2, outpath)
+        entries = filter_duplicates(db.entries, duplicate_index,
+                                    pending=True)
+        outputs = write_entries(entries, db.strings, duplicate_index)
         if copy:
             logging.info('skip copying %s: importing as single files', copy)
+        return outputs
     else:
+        if db.entries:
+            db.entries = list(filter_duplicates(db.entries, duplicate_index,
+                                                pending=True))
+            if duplicate_index is not None:
+                duplicate_index.clear()
+            if not db.entries:
+                logging.info('skip importing %s: only duplicates', path)
+                return []
+
         outpath = new_bib_path(path)
         if rename:
             if len(db.entries) > 1:
@@ -121,12 +566,216 @@ def import_bib(path, single=False, completions=None, copy=None, rename=False):
                               'more than one reference found')
             elif db.entries:
                 outpath = single_bib_path(db.entries[0])
-        write_database(db, outpath)
-        for ext in copy:
+        outputs = write_database(db, outpath)
+        if copy:
+            if copier is None:
+                with attachments.AttachmentCopier.from_config() as copier:
+                    copier.copy(path, outpath, copy)
+            else:
+                copier.copy(path, outpath, copy)
+        return outputs
+
+
+def _count_entries(entries):
+    """Yield the entries of the iterable `entries` and count them."""
+    for entry in entries:
+        stats.count('import.entries')
+        yield entry
+
+
+def queue_size():
+    """Return the number of items a stage of an import may run ahead of
+    the next stage (see `pipeline.prefetch`)."""
+    return conf.getint('import', 'queue_size', fallback=2)
+
+
+def _parse_batches(path, bparser, batch_size):
+    """Parse the bibtex file at `path` incrementally with `bparser` and
+    yield lists of `batch_size` entries."""
+    with open(path, 'r') as infile:
+        entries = bibtex.iter_entries(infile, bparser)
+        if stats.enabled:
+            entries = _count_entries(entries)
+        while batch := list(itertools.islice(entries, batch_size)):
+            yield batch
+
+
+def _complete_batches(batches, completions):
+    """Complete the lists of entries of the iterable `batches` with the
+    `complete.Completion` instances `completions` and yield them."""
+    completion_cache = open_completion_cache(completions)
+    try:
+        for entries in batches:
+            with stats.timer('complete'):
+                entries = complete.complete_many(entries, completions,
+                                                 completion_cache)
+            yield entries
+    finally:
+        if completion_cache is not None:
+            completion_cache.close()
+
+
+def import_bib_single(path, completions=None, duplicate_index=None):
+    """Import every entry of the bibtex file at the given path as a single
+    file.
+
+    The file is read incrementally with `bibtex.iter_entries` and every entry
+    is written as soon as it is completed, so arbitrarily large files can be
+    imported with bounded memory.  Like with `write_bib`, every file
+    contains all BibTeX strings of the imported file, which are read with
+    `bibtex.read_strings` first.  Returns the list of written paths.
+
+    Parsing, completing and writing the entries run concurrently: batches of
+    `complete.batch_size` entries are parsed and completed by their own
+    threads at most `queue_size()` batches ahead of writing.
+    """
+    completions = _completions(completions)
+    batch_size = conf.getint('complete', 'batch_size', fallback=100)
+    size = queue_size()
+
+    with open(path, 'r') as infile:
+        strings = bibtex.read_strings(infile)
+
+    bparser = bibtex.init_parser()
+    batches = pipeline.prefetch(_parse_batches(path, bparser, batch_size),
+                                size)
+    if completions:
+        batches = pipeline.prefetch(
+            _complete_batches(batches, completions), size)
+
+    with contextlib.closing(batches):
+        entries = filter_duplicates(itertools.chain.from_iterable(batches),
+                                    duplicate_index, pending=True)
+        return write_entries(entries, strings, duplicate_index)
+
+
+def import_bib(path, single=False, completions=None, copy=None, rename=False,
+               duplicate_index=None, copier=None):
+    """Import the bibtex file at the given path.
+
+    If `single` is `False`, the every import file is saved in the library.
+    If it is `True`, a new file will be created for every BibTeX entry
+    in the library; it's name will be the BibTeX key with the suffix '.bib'.
+    Duplicates of entries in the library are handled by `duplicate_index`
+    (see `open_duplicate_index`); if it is `None`, duplicates are not
+    detected.  The files next to `path` with the extensions in `copy` are
+    copied into the library by the `attachments.AttachmentCopier` `copier`,
+    which may still be copying them when this function returns; if it is
+    `None`, a copier is configured by the config and waited for.  Returns
+    the list of paths written to the library.
+    """
+    stats.count('import.files')
+    if single:
+        outputs = import_bib_single(path, completions, duplicate_index)
+        if copy:
+            logging.info('skip copying %s: importing as single files', copy)
+        return outputs
+
+    db = read_bib(path, completions)
+    return write_bib(path, db, single, copy, rename, duplicate_index, copier)
+
+
+def _read_bibs(paths, completions):
+    """Yield tuples `(path, db)` of the `paths` and the BibDatabases read
+    from them by `read_bib`."""
+    for path in paths:
+        yield path, read_bib(path, completions)
+
+
+def import_bibs(paths, single=False, completions=None, copy=None,
+                rename=False, duplicate_index=None, lib_manifest=None,
+                options=None, copier=None):
+    """Import the bibtex files at the given paths like `import_bib`.
+
+    Unless `single` is true, the next files are read and completed by a
+    thread at most `queue_size()` files ahead while the library is written,
+    which doesn't change the result.  Imported files are recorded in the
+    manifest `lib_manifest` like by `import_bibs_parallel`.
+    """
+    if single:
+        for path in paths:
+            outputs = import_bib(path, single, completions, copy, rename,
+                                 duplicate_index, copier)
+            if lib_manifest is not None:
+                lib_manifest.record(path, options, outputs)
+        return
+
+    dbs = pipeline.prefetch(_read_bibs(paths, completions), queue_size())
+    with contextlib.closing(dbs):
+        for path, db in dbs:
+            stats.count('import.files')
+            outputs = write_bib(path, db, single, copy, rename,
+                                duplicate_index, copier)
+            if lib_manifest is not None:
+                lib_manifest.record(path, options, outputs)
+
+
+def _init_worker(conf_dict, collect_stats=False):
+    """Initialize a worker process of `import_bibs_parallel`."""
+    conf.read_dict(conf_dict)
+    if collect_stats:
+        stats.enable()
+
+
+def _read_bib_worker(path, completions):
+    """Run `read_bib` in a worker process.
+
+    Returns a tuple `(db, caught_warnings, worker_stats)` so that the
+    warnings can be reported by the main process in a deterministic order.
+    `worker_stats` are the statistics of this call (see `stats.snapshot`)
+    or `None` if statistics are disabled.
+    """
+    stats.reset()
+    with warnings.catch_warnings(record=True) as caught_warnings:
+        warnings.simplefilter('always')
+        db = read_bib(path, completions)
+    worker_stats = stats.snapshot() if stats.enabled else None
+    return db, [w.message for w in caught_warnings], worker_stats
+
+
+def import_bibs_parallel(paths, jobs, single=False, completions=None,
+                         copy=None, rename=False, duplicate_index=None,
+                         lib_manifest=None, options=None, copier=None):
+    """Import the bibtex files at the given paths using `jobs` processes.
+
+    The files are read, customized and completed by a pool of worker
+    processes while the library is written by the calling process in the
+    order of `paths`, so the result is the same as calling `import_bib` for
+    every path.  Errors while reading a file are reported as warnings and
+    don't abort the import of the other files.  Imported files are recorded
+    in the manifest `lib_manifest` with the options signature `options`
+    unless it is `None`.  Attachments are copied by `copier` like by
+    `import_bib`.
+    """
+    conf_dict = {section: dict(conf.items(section, raw=True))
+                 for section in conf.sections()}
+
+    if (conf.getboolean('bibtex', 'abbreviate_journals', fallback=False)
+            or conf.getboolean('bibtex', 'normalize_journals',
+                               fallback=False)):
+        # load the journal abbreviations once; forked workers share them
+        bibtex.Journals.ensure_loaded()
+
+    initargs = (conf_dict, stats.enabled)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=initargs) as executor:
+        futures = [executor.submit(_read_bib_worker, path, completions)
+                   for path in paths]
+        for path, future in zip(paths, futures):
             try:
-                src = subs_ext(path, ext)
-                dst = subs_ext(outpath, ext)
-                logging.info('copying %s to %s', src, dst)
-                shutil.copyfile(src, dst)
-            except FileNotFoundError:
+                db, caught_warnings, worker_stats = future.result()
+            except Exception as exc:
+                msg = f'skipping importing {path}: {exc}'
+                warnings.warn(msg, RuntimeWarning)
                 continue
+
+            for message in caught_warnings:
+                warnings.warn(message)
+            if worker_stats is not None:
+                stats.merge(worker_stats)
+            stats.count('import.files')
+
+            outputs = write_bib(path, db, single, copy, rename,
+                                duplicate_index, copier)
+            if lib_manifest is not None:
+                lib_manifest.record(path, options, outputs)
@@ -0,0 +1,229 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Complete references offline with a snapshot of the arXiv metadata.
+
+A bulk dump of the arXiv metadata, as JSON lines like the arXiv dataset on
+Kaggle, is compiled once into an index file mapping DOIs to the arXiv
+articles, which is memory-mapped for lookups.
+"""
+
+import gzip
+import heapq
+import itertools
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+from . import bibtex
+
+
+#: Prefix of the entry IDs of arXiv articles.
+ENTRY_ID_PREFIX = 'http://arxiv.org/abs/'
+
+
+def _open_dump(path):
+    """Open the dump at `path`, which may be compressed with gzip, for
+    reading bytes."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _dump_records(path):
+    """Yield tuples `(doi, value)` of encoded canonical DOIs and the values
+    stored for them for the articles in the dump at `path`.
+
+    The value is the arXiv ID with the latest version and the primary
+    category separated by a tab.  Lines which are no valid JSON objects are
+    skipped with a log message.
+    """
+    with _open_dump(path) as dump:
+        for number, line in enumerate(dump, 1):
+            if not line.strip():
+                continue
+            try:
+                article = json.loads(line)
+                dois = article.get('doi') or ''
+                arxiv_id = article['id']
+            except (ValueError, KeyError, AttributeError) as exc:
+                logging.info('skipping line %s of %s: %s', number, path, exc)
+                continue
+            if not dois:
+                continue
+
+            versions = article.get('versions') or []
+            if versions and isinstance(versions[-1], dict):
+                arxiv_id += versions[-1].get('version', '')
+            categories = (article.get('categories') or '').split()
+            category = categories[0] if categories else ''
+            value = f'{arxiv_id}\t{category}'.encode('utf-8')
+            # articles may have several DOIs separated by whitespace
+            for doi in dois.split():
+                yield bibtex.canonical_doi(doi).encode('utf-8'), value
+
+
+def _write_run(records, dirname):
+    """Write the sorted `records` to a temporary file in `dirname` and
+    return its path."""
+    fd, path = tempfile.mkstemp(prefix='run', dir=dirname)
+    with os.fdopen(fd, 'wb') as run:
+        for doi, value in sorted(records):
+            run.write(doi + b'\t' + value + b'\n')
+    return path
+
+
+def _read_run(run):
+    """Yield the tuples `(doi, value)` of the run file object `run`."""
+    for line in run:
+        doi, _, value = line.rstrip(b'\n').partition(b'\t')
+        yield doi, value
+
+
+class ArxivSnapshot:
+    """A memory-mapped index of the arXiv articles by DOI at `path`.
+
+    The file is a `bibtex.MappedTable` from canonical DOIs to the arXiv ID
+    and primary category of the articles with that DOI.  It consists of a
+    header (`HEADER`), the strings and the index records.  Build it with
+    `build`.  Raises an `OSError` or `ValueError` if the file cannot be
+    read.
+    """
+
+    #: Header of the index: magic bytes, version, number of DOIs and offset
+    #: of the index records.
+    HEADER = struct.Struct('<4sIQQ')
+    MAGIC = b'RMAX'
+    #: Version of the layout of the index.
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._buffer = mmap.mmap(file.fileno(), 0,
+                                     access=mmap.ACCESS_READ)
+        try:
+            magic, version, count, offset = self.HEADER.unpack_from(
+                self._buffer)
+        except struct.error:
+            raise ValueError(f'{path} is no arXiv snapshot') from None
+        if magic != self.MAGIC:
+            raise ValueError(f'{path} is no arXiv snapshot')
+        if version != self.VERSION:
+            raise ValueError(f'{path} has version {version} instead of '
+                             f'{self.VERSION}; build it again')
+        # DOIs rarely repeat, and a memo would grow without bound in the
+        # daemon
+        self._table = bibtex.MappedTable(self._buffer, offset, count,
+                                         memoize=False)
+
+    def __len__(self):
+        return len(self._table)
+
+    def lookup(self, doi):
+        """Return the list of fields to add for the arXiv articles with the
+        DOI `doi` like `complete._arxiv_fields`."""
+        value = self._table.get(bibtex.canonical_doi(doi))
+        if value is None:
+            return []
+        matches = []
+        for article in value.split('\n'):
+            arxiv_id, _, category = article.partition('\t')
+            matches.append({'eprint': ENTRY_ID_PREFIX + arxiv_id,
+                            'eprintclass': category,
+                            'eprinttype': 'arxiv'})
+        return matches
+
+    @classmethod
+    def build(cls, dump_path, path, chunk_size=200000):
+        """Compile the dump at `dump_path` into an index at `path` and
+        return the number of DOIs.
+
+        The dump is streamed: chunks of `chunk_size` records are sorted
+        into temporary files next to `path`, which are merged into the
+        index, so the memory doesn't depend on the size of the dump.
+        Articles sharing a DOI are stored together.
+        """
+        dirname = os.path.dirname(os.path.abspath(path))
+        with tempfile.TemporaryDirectory(dir=dirname) as tmpdir:
+            records = _dump_records(dump_path)
+            runs = []
+            while chunk := list(itertools.islice(records, chunk_size)):
+                runs.append(_write_run(chunk, tmpdir))
+                logging.info('sorted %s records of %s',
+                             len(runs) * chunk_size, dump_path)
+
+            tmp_path = os.path.join(tmpdir, 'snapshot')
+            records_path = os.path.join(tmpdir, 'records')
+            files = [open(run, 'rb') for run in runs]
+            try:
+                merged = heapq.merge(*(_read_run(run) for run in files))
+                count = cls._write(merged, tmp_path, records_path)
+            finally:
+                for file in files:
+                    file.close()
+            os.replace(tmp_path, path)
+        return count
+
+    @classmethod
+    def _write(cls, records, path, records_path):
+        """Write the sorted `records` as index to `path` using the
+        temporary file `records_path` and return the number of DOIs."""
+        record = bibtex.MappedTable.RECORD
+        count = 0
+        with open(path, 'wb') as file, open(records_path, 'w+b') as index:
+            file.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, 0, 0))
+            offset = cls.HEADER.size
+
+            for doi, group in itertools.groupby(records, lambda r: r[0]):
+                # unique values in the order of the dump
+                value = b'\n'.join(dict.fromkeys(v for _, v in group))
+                if offset + len(doi) + len(value) >= 1 << 32:
+                    raise ValueError('arXiv snapshot too large')
+                index.write(record.pack(offset, len(doi),
+                                        offset + len(doi), len(value)))
+                file.write(doi)
+                file.write(value)
+                offset += len(doi) + len(value)
+                count += 1
+
+            index.seek(0)
+            while chunk := index.read(1 << 20):
+                file.write(chunk)
+            file.seek(0)
+            file.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, count, offset))
+        return count
+
+
+_snapshots = {}
+
+
+def open_snapshot(path):
+    """Return the `ArxivSnapshot` at `path`.
+
+    The snapshot is opened once per path and kept open.  It is opened again
+    if the file was replaced, e.g., by building it again while the daemon
+    runs.
+    """
+    stat = os.stat(path)
+    stamp = stat.st_ino, stat.st_mtime_ns
+    if path not in _snapshots or _snapshots[path][0] != stamp:
+        logging.debug('opening arXiv snapshot %s', path)
+        _snapshots[path] = stamp, ArxivSnapshot(path)
+    return _snapshots[path][1]
@@ -0,0 +1,191 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Collect timings and counters of the stages of refmgr.
+
+Collecting is disabled by default; then `timer` returns a shared no-op
+context manager and `count` returns immediately.  Timers measure the
+exclusive time of a stage per thread: while a nested timer runs, the time
+is attributed to the nested stage only.
+"""
+
+import contextlib
+import functools
+import json
+import sys
+import threading
+import time
+
+
+#: Whether statistics are collected.
+enabled = False
+
+_lock = threading.Lock()
+_timers = {}
+_counters = {}
+_local = threading.local()
+_start = None
+_null_timer = contextlib.nullcontext()
+
+
+def enable():
+    """Start collecting statistics."""
+    global enabled, _start
+    enabled = True
+    _start = time.perf_counter()
+
+
+def disable():
+    """Stop collecting statistics and forget the collected ones."""
+    global enabled
+    enabled = False
+    reset()
+
+
+def reset():
+    """Forget the collected statistics."""
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+
+
+class _Timer:
+    """Context manager adding the exclusive time of its block to the timer
+    `name`."""
+
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    @staticmethod
+    def _stack():
+        try:
+            return _local.stack
+        except AttributeError:
+            _local.stack = []
+            return _local.stack
+
+    @staticmethod
+    def _add(name, calls, seconds):
+        with _lock:
+            timer = _timers.setdefault(name, [0, 0.0])
+            timer[0] += calls
+            timer[1] += seconds
+
+    def __enter__(self):
+        now = time.perf_counter()
+        stack = self._stack()
+        if stack:
+            self._add(stack[-1], 0, now - _local.last)
+        stack.append(self.name)
+        _local.last = now
+        self._add(self.name, 1, 0.0)
+
+    def __exit__(self, *exc_info):
+        now = time.perf_counter()
+        stack = self._stack()
+        self._add(stack.pop(), 0, now - _local.last)
+        _local.last = now
+
+
+def timer(name):
+    """Return a context manager timing its block as the stage `name`."""
+    if not enabled:
+        return _null_timer
+    return _Timer(name)
+
+
+def timed(name, function):
+    """Return `function` wrapped to time every call as the stage `name`."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with _Timer(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def count(name, value=1):
+    """Add `value` to the counter `name`."""
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def snapshot():
+    """Return the collected statistics as a JSON serializable dict."""
+    with _lock:
+        return {
+            'timers': {name: {'calls': calls, 'seconds': seconds}
+                       for name, (calls, seconds) in sorted(_timers.items())},
+            'counters': dict(sorted(_counters.items())),
+            }
+
+
+def merge(other):
+    """Add the statistics `other` returned by `snapshot`, e.g. by another
+    process, to the collected ones."""
+    for name, timing in other['timers'].items():
+        _Timer._add(name, timing['calls'], timing['seconds'])
+    for name, value in other['counters'].items():
+        count(name, value)
+
+
+def hit_rates(counters):
+    """Return the dict of hit rates of the caches with the counters
+    `<cache>.hits` and `<cache>.misses` in `counters`."""
+    rates = {}
+    for name, hits in counters.items():
+        cache, _, suffix = name.rpartition('.')
+        if suffix != 'hits':
+            continue
+        total = hits + counters.get(f'{cache}.misses', 0)
+        if total:
+            rates[cache] = hits / total
+    return rates
+
+
+def report(fmt='text', file=None):
+    """Print the collected statistics in the format `fmt` ('text' or
+    'json') to `file` (default: stdout)."""
+    if file is None:
+        file = sys.stdout
+    stats = snapshot()
+    stats['wall_seconds'] = time.perf_counter() - _start
+    stats['hit_rates'] = hit_rates(stats['counters'])
+
+    if fmt == 'json':
+        json.dump(stats, file, indent=2)
+        print(file=file)
+        return
+
+    print(f"{'stage':40} {'calls':>10} {'seconds':>10}", file=file)
+    for name, timing in stats['timers'].items():
+        print(f"{name:40} {timing['calls']:>10} {timing['seconds']:>10.3f}",
+              file=file)
+    print(f"{'total (wall time)':40} {'':>10} {stats['wall_seconds']:>10.3f}",
+          file=file)
+    if stats['counters']:
+        print(file=file)
+        print(f"{'counter':40} {'value':>10}", file=file)
+        for name, value in stats['counters'].items():
+            print(f'{name:40} {value:>10}', file=file)
+    if stats['hit_rates']:
+        print(file=file)
+        print(f"{'cache':40} {'hit rate':>10}", file=file)
+        for name, rate in stats['hit_rates'].items():
+            print(f'{name:40} {rate:>10.1%}', file=file)
@@ -15,16 +15,27 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
-"""CLI interface of refmgr."""
+"""CLI interface of refmgr.
+
+Only light modules are imported here: the modules providing the choices
+of the options, the statistics and the daemon client only import the
+standard library.  The commands import the modules they need when they
+run, so trivial commands like `refmgr --version` don't pay for importing
+`bibtex`, bibtexparser or arxiv.
+"""
 
 import argparse
+import functools
 import os.path
 import sys
 
 from . import __version__, conf
+from . import attachments
 from . import config
-from .references import import_refs
 from . import complete
+from . import daemon
+from . import duplicates
+from . import stats
 
 
 def show_config(args):
@@ -49,10 +60,204 @@ def add_config_parser(subparsers):
     return config_parser
 
 
-def main():
-    """Main program.
+def build_journals(args):
+    """Compile the journal abbreviations."""
+    from . import bibtex
+
+    path = bibtex.Journals.build(args.csv, args.output)
+    print(path)
+
+
+def add_journals_parser(subparsers):
+    """Add the journals (sub)parser and return it."""
+    journals_parser = subparsers.add_parser('journals')
+    journals_subparsers = journals_parser.add_subparsers()
+
+    build_parser = journals_subparsers.add_parser('build')
+    build_parser.set_defaults(func=build_journals)
+    build_parser.add_argument('--csv', help='CSV file with the journal '
+                              'abbreviations (default: the bundled file)')
+    build_parser.add_argument('-o', '--output', help='output file (default: '
+                              'next to the CSV file with suffix .bin)')
+
+    return journals_parser
+
+
+def build_arxiv_snapshot(args):
+    """Compile an arXiv metadata dump into a snapshot."""
+    from . import snapshot
+
+    output = args.output or conf.get('complete', 'arxiv_snapshot',
+                                     fallback=None)
+    if not output:
+        sys.exit('refmgr: no output file: use --output or set the config '
+                 'option complete.arxiv_snapshot')
+    output = os.path.expanduser(output)
+    count = snapshot.ArxivSnapshot.build(args.dump, output)
+    print(f'{output}: {count} DOIs')
+
+
+def add_arxiv_parser(subparsers):
+    """Add the arxiv (sub)parser and return it."""
+    arxiv_parser = subparsers.add_parser('arxiv')
+    arxiv_subparsers = arxiv_parser.add_subparsers()
+
+    build_parser = arxiv_subparsers.add_parser('build')
+    build_parser.set_defaults(func=build_arxiv_snapshot)
+    build_parser.add_argument('dump', help='arXiv metadata as JSON lines, '
+                              'optionally compressed with gzip (.gz)')
+    build_parser.add_argument('-o', '--output', help='output file (default: '
+                              'the config option complete.arxiv_snapshot)')
+
+    return arxiv_parser
+
+
+def _completion_cache():
+    """Return the completion cache of the library."""
+    from . import cache
+    from . import references
+
+    return cache.CompletionCache.from_config(
+        references.data_path('completions.sqlite'))
+
 
-    Currently, only a short notice is printed.
+def show_cache_stats(args):
+    """Print out statistics about the completion cache."""
+    with _completion_cache() as completion_cache:
+        for key, value in completion_cache.stats().items():
+            print(f'{key}: {value}')
+
+
+def clear_cache(args):
+    """Remove all results from the completion cache."""
+    with _completion_cache() as completion_cache:
+        completion_cache.clear()
+
+
+def add_cache_parser(subparsers):
+    """Add the cache (sub)parser and return it."""
+    cache_parser = subparsers.add_parser('cache')
+    cache_parser.set_defaults(func=show_cache_stats)
+    cache_subparsers = cache_parser.add_subparsers()
+
+    stats_parser = cache_subparsers.add_parser('stats')
+    stats_parser.set_defaults(func=show_cache_stats)
+
+    clear_parser = cache_subparsers.add_parser('clear')
+    clear_parser.set_defaults(func=clear_cache)
+
+    return cache_parser
+
+
+def add_import_options(parser):
+    """Add the options for importing references to `parser`."""
+    parser.add_argument('--single', action='store_true')
+    parser.add_argument('--rename', action='store_true')
+    valid_completions = [c.lower() for c in complete.Completion.__members__]
+    parser.add_argument('-c', '--complete', action='append',
+                        choices=valid_completions)
+    parser.add_argument('--copy', action='append')
+    valid_modes = [m.lower() for m in attachments.CopyMode.__members__]
+    parser.add_argument('--copy-mode', choices=valid_modes,
+                        help='how to transfer the files of --copy into the '
+                        'library (default: copy)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of processes reading the files')
+    valid_policies = [p.lower() for p in duplicates.Policy.__members__]
+    parser.add_argument('--duplicates', choices=valid_policies,
+                        help='how to handle duplicates of entries in the '
+                        'library (default: report)')
+
+
+def import_refs(args):
+    """Import the given references.
+
+    If requested by `args.stats` and `args.profile`, statistics of the
+    import are printed and the whole import is profiled, respectively.
+    """
+    if args.stats:
+        stats.enable()
+    if args.profile:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+
+    try:
+        from . import references
+
+        references.import_refs(args)
+    finally:
+        if args.profile:
+            profile.disable()
+            profile.dump_stats(args.profile)
+        if args.stats:
+            stats.report(args.stats_format)
+            stats.disable()
+
+
+def export_refs(args):
+    """Export entries of the library into a single BibTeX file."""
+    from . import references
+
+    references.export_refs(args)
+
+
+def watch_refs(args):
+    """Import new or changed BibTeX files in a directory until
+    interrupted."""
+    from . import references
+
+    try:
+        references.watch_refs(args)
+    except KeyboardInterrupt:
+        pass
+
+
+def index_library(args):
+    """Update the catalog of the library."""
+    from . import references
+
+    references.index_library(args)
+
+
+def lookup_refs(args):
+    """Print the entries of the library matching the given criteria."""
+    from . import references
+
+    references.lookup_refs(args)
+
+
+def search_refs(args):
+    """Print the entries of the library best matching a full-text
+    search."""
+    from . import references
+
+    references.search_refs(args)
+
+
+def serve(args):
+    """Run the commands forwarded by the CLI until interrupted."""
+    path = daemon.socket_path(args.c)
+    server = daemon.Server(args.c, path, FORWARDED_COMMANDS)
+    print(f'refmgr: listening at {path}', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except RuntimeError as exc:
+        sys.exit(f'refmgr: {exc}')
+    except KeyboardInterrupt:
+        pass
+
+
+#: Commands run by the daemon if it is running.
+FORWARDED_COMMANDS = {import_refs, lookup_refs, export_refs, search_refs}
+
+
+@functools.cache
+def _make_parser():
+    """Return the argument parser.
+
+    The parser is built once, so the daemon doesn't build it for every
+    command.
     """
     default_conf_path = '~/.config/refmgr/conf'
 
@@ -61,28 +266,106 @@ def main():
                         version=f'This is %(prog)s, version {__version__}.')
     parser.add_argument('-c', action='store', default=default_conf_path,
                         help=f"config file (default: '{default_conf_path}'")
+    parser.add_argument('--no-daemon', action='store_true',
+                        help='run the command in this process even if '
+                        'the daemon is running')
     subparsers = parser.add_subparsers()
 
     config_parser = add_config_parser(subparsers)
+    cache_parser = add_cache_parser(subparsers)
+    journals_parser = add_journals_parser(subparsers)
+    arxiv_parser = add_arxiv_parser(subparsers)
 
     import_parser = subparsers.add_parser('import')
     import_parser.set_defaults(func=import_refs)
-    import_parser.add_argument('--single', action='store_true')
-    import_parser.add_argument('--rename', action='store_true')
-    valid_completions = [c.lower() for c in complete.Completion.__members__]
-    import_parser.add_argument('-c', '--complete', action='append',
-                               choices=valid_completions)
-    import_parser.add_argument('--copy', action='append')
+    add_import_options(import_parser)
+    import_parser.add_argument('--force', action='store_true',
+                               help='import files even if they are '
+                               'unchanged since the last import')
+    import_parser.add_argument('--stats', action='store_true',
+                               help='print the time and number of calls of '
+                               'every stage and further counters')
+    import_parser.add_argument('--stats-format', choices=['text', 'json'],
+                               default='text',
+                               help='format of the statistics printed by '
+                               '--stats (default: text)')
+    import_parser.add_argument('--profile', metavar='FILE',
+                               help='write cProfile statistics of the '
+                               'import to FILE')
     import_parser.add_argument('refs', nargs='+')
 
-    # parse the command line arguments
-    args = parser.parse_args()
+    watch_parser = subparsers.add_parser('watch')
+    watch_parser.set_defaults(func=watch_refs, force=False)
+    add_import_options(watch_parser)
+    watch_parser.add_argument('dir', help='directory to watch')
+
+    export_parser = subparsers.add_parser('export')
+    export_parser.set_defaults(func=export_refs)
+    export_parser.add_argument('-o', '--output',
+                               help='output file (default: stdout)')
+    export_parser.add_argument('refs', nargs='*',
+                               help='keys, DOIs or eprints of the entries to '
+                               'export (default: all entries)')
+
+    index_parser = subparsers.add_parser('index')
+    index_parser.set_defaults(func=index_library)
+    index_parser.add_argument('--rebuild', action='store_true',
+                              help='rebuild the catalog from scratch')
+    index_parser.add_argument('-j', '--jobs', type=int, default=1,
+                              help='number of processes parsing the files')
+
+    lookup_parser = subparsers.add_parser('lookup')
+    lookup_parser.set_defaults(func=lookup_refs)
+    lookup_parser.add_argument('--key')
+    lookup_parser.add_argument('--doi')
+    lookup_parser.add_argument('--eprint')
+    lookup_parser.add_argument('--author',
+                               help='last name of an author')
+    lookup_parser.add_argument('query', nargs='?',
+                               help='key, DOI or eprint to look up')
+
+    search_parser = subparsers.add_parser('search')
+    search_parser.set_defaults(func=search_refs)
+    search_parser.add_argument('-n', '--limit', type=int, default=20,
+                               help='maximal number of results '
+                               '(default: 20)')
+    search_parser.add_argument('query', nargs='+',
+                               help='words in the title, abstract, authors, '
+                               'keywords or journal; a word ending with * '
+                               'matches all words starting with it')
+
+    serve_parser = subparsers.add_parser('serve')
+    serve_parser.set_defaults(func=serve)
+
+    return parser
+
+
+def parse_args(argv=None):
+    """Parse the command line arguments `argv` (default: `sys.argv[1:]`)
+    and return them."""
+    args = _make_parser().parse_args(argv)
 
     # prevent errors due to missing tilde expansion (e.g. in open)
     args.c = os.path.realpath(
         os.path.normpath(
             os.path.expanduser(
                 args.c)))
+    return args
+
+
+def main():
+    """Main program.
+
+    The commands in `FORWARDED_COMMANDS` are run by the daemon if it is
+    running (see `refmgr serve`).
+    """
+    args = parse_args()
+
+    if (getattr(args, 'func', None) in FORWARDED_COMMANDS
+            and not args.no_daemon):
+        status = daemon.forward(args.c, sys.argv[1:])
+        if status is not None:
+            sys.exit(status)
 
     # parse the config file
     config.load(conf, args.c)
@@ -0,0 +1,219 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Watch a directory for new or changed BibTeX files."""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+import warnings
+
+
+def _is_bib_file(name):
+    """Return whether `name` is the name of a BibTeX file to import.
+
+    Hidden files are ignored since they are typically temporary files of
+    programs writing BibTeX files.
+    """
+    return name.endswith('.bib') and not name.startswith('.')
+
+
+def _stamp(path):
+    """Return a tuple identifying the content of the file at `path` or
+    `None` if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def bib_files(dirname):
+    """Return the paths of the BibTeX files in the directory `dirname`."""
+    with os.scandir(dirname) as it:
+        return {dir_entry.path for dir_entry in it
+                if _is_bib_file(dir_entry.name) and dir_entry.is_file()}
+
+
+class InotifyWatcher:
+    """Watch the directory `dirname` with inotify.
+
+    Raises an `OSError` if inotify is not available.
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        try:
+            inotify_init1 = libc.inotify_init1
+            inotify_add_watch = libc.inotify_add_watch
+        except AttributeError:
+            raise OSError('inotify is not available') from None
+
+        self._fd = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        mask = (self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO
+                | self.IN_CREATE)
+        if inotify_add_watch(self._fd, os.fsencode(dirname), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, os.strerror(errno), dirname)
+
+        self._poll = select.poll()
+        self._poll.register(self._fd, select.POLLIN)
+
+    def close(self):
+        """Stop watching."""
+        os.close(self._fd)
+
+    def wait(self, timeout=None):
+        """Wait at most `timeout` seconds (forever if `None`) for changes
+        and return the set of paths of the new or changed BibTeX files."""
+        ms = None if timeout is None else max(0, int(1000 * timeout))
+        if not self._poll.poll(ms):
+            return set()
+
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = self.EVENT.unpack_from(data, offset)
+                offset += self.EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & self.IN_Q_OVERFLOW:
+                    logging.debug('inotify queue overflow; rescanning %s',
+                                  self.dirname)
+                    changed.update(bib_files(self.dirname))
+                    continue
+                name = os.fsdecode(name)
+                if _is_bib_file(name):
+                    changed.add(os.path.join(self.dirname, name))
+        return changed
+
+
+class PollingWatcher:
+    """Watch the directory `dirname` by listing it every `interval`
+    seconds."""
+
+    def __init__(self, dirname, interval=0.5):
+        self.dirname = dirname
+        self.interval = interval
+        self._stamps = self._scan()
+
+    def _scan(self):
+        return {path: _stamp(path) for path in bib_files(self.dirname)}
+
+    def close(self):
+        """Stop watching."""
+
+    def wait(self, timeout=None):
+        """Wait at most `timeout` seconds (forever if `None`) for changes
+        and return the set of paths of the new or changed BibTeX files."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stamps = self._scan()
+            changed = {path for path, stamp in stamps.items()
+                       if self._stamps.get(path) != stamp}
+            self._stamps = stamps
+            if changed:
+                return changed
+
+            delay = self.interval
+            if deadline is not None:
+                delay = min(delay, deadline - time.monotonic())
+                if delay <= 0:
+                    return set()
+            time.sleep(delay)
+
+
+def open_watcher(dirname, poll_interval=0.5):
+    """Return an `InotifyWatcher` for `dirname` or a `PollingWatcher` if
+    inotify is not available."""
+    try:
+        return InotifyWatcher(dirname)
+    except OSError as exc:
+        logging.info('watching %s by polling: %s', dirname, exc)
+        return PollingWatcher(dirname, poll_interval)
+
+
+def watch(dirname, import_paths, settle=0.25, poll_interval=0.5):
+    """Watch the directory `dirname` and call `import_paths` with lists of
+    paths of new or changed BibTeX files.
+
+    A file is imported once its size and modification time didn't change
+    for `settle` seconds, so files which are still being written are not
+    imported.  Files which became ready together are imported with a single
+    call.  The BibTeX files in `dirname` are considered new when watching
+    starts.  Exceptions raised by `import_paths` are reported as warnings.
+    This function never returns.
+    """
+    watcher = open_watcher(dirname, poll_interval)
+    pending = {}
+    changed = bib_files(dirname)
+    try:
+        while True:
+            now = time.monotonic()
+            for path in changed:
+                pending[path] = (_stamp(path), now)
+
+            ready = []
+            for path, (stamp, since) in list(pending.items()):
+                if now - since < settle:
+                    continue
+                new_stamp = _stamp(path)
+                if new_stamp is None:
+                    del pending[path]
+                elif new_stamp == stamp:
+                    ready.append(path)
+                    del pending[path]
+                else:
+                    pending[path] = (new_stamp, now)
+
+            if ready:
+                ready.sort()
+                logging.info('importing %s', ready)
+                try:
+                    import_paths(ready)
+                except Exception as exc:
+                    msg = f'importing {ready} failed: {exc}'
+                    warnings.warn(msg, RuntimeWarning)
+
+            timeout = None
+            if pending:
+                first = min(since for _, since in pending.values())
+                timeout = max(0, first + settle - time.monotonic())
+            changed = watcher.wait(timeout)
+    finally:
+        watcher.close()
@@ -0,0 +1,250 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Write BibTeX files to the library atomically."""
+
+from concurrent.futures import ThreadPoolExecutor
+import enum
+import logging
+import os
+import tempfile
+import warnings
+
+from bibtexparser.bibdatabase import BibDatabase
+
+from . import conf
+from . import bibtex
+from . import stats
+
+
+class Durability(enum.Enum):
+    """Possible ways to make written files durable."""
+    #: Sync every file and its directory before it is renamed.
+    FILE = enum.auto()
+    #: Sync all files of a batch before they are renamed and their
+    #: directories once afterwards.
+    BATCH = enum.auto()
+    #: Don't sync; files are still replaced atomically.
+    NONE = enum.auto()
+
+
+def _fsync_path(path):
+    """Sync the file or directory at `path` to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _current_umask():
+    """Return the umask of the process."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+class LibraryWriter:
+    """Write BibDatabases to files in batches.
+
+    Every file is written to a temporary file in the same directory, which
+    is renamed to its destination afterwards, so a crash never leaves a
+    truncated file behind.  The files of a batch are rendered by a single
+    BibTexWriter and written by a pool of `workers` threads.  `durability`
+    is the `Durability` of the written files.
+
+    `write` only queues a file; the batch is written by `flush`, which should
+    be called as soon as `full` is true, and by `close`.  Written files are
+    added to the catalog `lib_catalog` unless it is `None` and to the list
+    `written`.
+    """
+
+    def __init__(self, lib_catalog=None, durability=Durability.BATCH,
+                 workers=4, batch_size=256):
+        self.catalog = lib_catalog
+        self.durability = durability
+        self.batch_size = batch_size
+        self._bwriter = bibtex.init_writer()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._mode = 0o666 & ~_current_umask()
+        self._queued = []
+        #: Paths of the files written so far.
+        self.written = []
+
+    @classmethod
+    def from_config(cls, lib_catalog=None):
+        """Return a writer configured by the config section `library`."""
+        durability = conf.get('library', 'fsync', fallback='batch')
+        return cls(
+            lib_catalog,
+            durability=Durability[durability.upper()],
+            workers=conf.getint('library', 'write_workers', fallback=4),
+            batch_size=conf.getint('library', 'write_batch_size',
+                                   fallback=256),
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def full(self):
+        """Whether the current batch is full."""
+        return len(self._queued) >= self.batch_size
+
+    def write(self, db, outpath, overwrite=False):
+        """Queue writing the BibDatabase `db` to the path `outpath`.
+
+        If `overwrite` is `False` and `outpath` exists, the file is skipped
+        with a warning when the batch is written.
+        """
+        self._queued.append((outpath, list(db.entries), dict(db.strings),
+                             overwrite))
+
+    def _publish(self, tmp, outpath, overwrite):
+        """Rename the temporary file `tmp` to `outpath`.
+
+        Returns `False` and removes `tmp` if `overwrite` is `False` and
+        `outpath` exists.
+        """
+        if overwrite:
+            if os.path.exists(outpath):
+                logging.info('overwriting %s', outpath)
+            os.replace(tmp, outpath)
+            return True
+
+        try:
+            # unlike a rename, a link never replaces an existing file
+            os.link(tmp, outpath)
+        except FileExistsError:
+            os.unlink(tmp)
+            return False
+        except OSError:
+            # the file system doesn't support hard links
+            if os.path.exists(outpath):
+                os.unlink(tmp)
+                return False
+            os.replace(tmp, outpath)
+            return True
+        os.unlink(tmp)
+        return True
+
+    def _write_file(self, outpath, text, overwrite):
+        """Write `text` to a temporary file next to `outpath`.
+
+        Unless the durability is per batch, the temporary file is renamed
+        to `outpath` right away.  Returns a tuple `(tmp, published, size)`
+        where `published` is `None` if the file wasn't renamed yet and
+        `size` is the size of the file if statistics are enabled and 0
+        otherwise.
+        """
+        dirname, basename = os.path.split(outpath)
+        fd, tmp = tempfile.mkstemp(prefix=f'.{basename}.', suffix='.tmp',
+                                   dir=dirname)
+        try:
+            os.fchmod(fd, self._mode)
+            with open(fd, 'w') as outfile:
+                logging.info('writing to %s', outpath)
+                outfile.write(text)
+                if self.durability is Durability.FILE:
+                    outfile.flush()
+                    os.fsync(outfile.fileno())
+            size = os.path.getsize(tmp) if stats.enabled else 0
+            if self.durability is Durability.BATCH:
+                return tmp, None, size
+
+            published = self._publish(tmp, outpath, overwrite)
+            if self.durability is Durability.FILE:
+                _fsync_path(dirname or os.curdir)
+            return tmp, published, size
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def flush(self):
+        """Write the queued files.
+
+        The first error raised while writing is re-raised after the other
+        files of the batch have been written and added to the catalog.
+        """
+        queued, self._queued = self._queued, []
+        if not queued:
+            return
+
+        with stats.timer('write'):
+            self._flush(queued)
+
+    def _flush(self, queued):
+        """Write the files `queued` by `write`."""
+        futures = []
+        db = BibDatabase()
+        for outpath, entries, strings, overwrite in queued:
+            db.entries = entries
+            db.strings = strings
+            text = self._bwriter.write(db)
+            futures.append(self._executor.submit(
+                self._write_file, outpath, text, overwrite))
+
+        error = None
+        written = []
+        for (outpath, entries, _, overwrite), future in zip(queued, futures):
+            try:
+                tmp, published, size = future.result()
+            except Exception as exc:
+                error = error or exc
+                continue
+            written.append((outpath, entries, overwrite, tmp, published,
+                            size))
+
+        if self.durability is Durability.BATCH:
+            list(self._executor.map(
+                _fsync_path, [tmp for _, _, _, tmp, _, _ in written]))
+            written = [(outpath, entries, overwrite, tmp,
+                        self._publish(tmp, outpath, overwrite), size)
+                       for outpath, entries, overwrite, tmp, _, size
+                       in written]
+            for dirname in {os.path.dirname(outpath) or os.curdir
+                            for outpath, *_ in written}:
+                _fsync_path(dirname)
+
+        for outpath, _, _, _, published, _ in written:
+            if not published:
+                msg = f"skipping writing to {outpath}: file already exists"
+                warnings.warn(msg, RuntimeWarning)
+
+        published = [(outpath, entries, size)
+                     for outpath, entries, _, _, published, size in written
+                     if published]
+        written = [(outpath, entries) for outpath, entries, _ in published]
+        self.written.extend(outpath for outpath, _ in written)
+        stats.count('write.files', len(written))
+        stats.count('write.bytes', sum(size for _, _, size in published))
+        if self.catalog is not None:
+            with stats.timer('catalog'):
+                self.catalog.update_files(written)
+
+        if error is not None:
+            raise error
+
+    def close(self):
+        """Write the queued files and shut down the thread pool."""
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown()
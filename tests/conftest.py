@@ -0,0 +1,52 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+
+from refmgr import conf
+from refmgr import config
+from refmgr import references
+from refmgr import ui
+
+
+def _reset_conf():
+    conf.clear()
+    conf.read_dict(config.default())
+
+
+@pytest.fixture
+def library(tmp_path):
+    """Return the path of an empty library configured by the default
+    config."""
+    path = tmp_path / 'library'
+    path.mkdir()
+    _reset_conf()
+    conf['library']['path'] = str(path)
+    yield path
+    for lib_catalog in references._catalogs.values():
+        lib_catalog.close()
+    references._catalogs.clear()
+    _reset_conf()
+
+
+@pytest.fixture
+def refmgr():
+    """Return a function running refmgr with the given command line
+    arguments without the daemon and the config file."""
+    def run(*argv):
+        args = ui.parse_args(['--no-daemon', *argv])
+        args.func(args)
+    return run
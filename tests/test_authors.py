@@ -0,0 +1,38 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from bibtexparser.customization import author, getnames
+import pytest
+
+from refmgr import authors
+
+
+@pytest.mark.parametrize('field', [
+    'Fuchs, Jacob and Doe, Jane',
+    'Fuchs, Jacob AND Doe, Jane And John Smith',
+    'Fuchs, Jacob and\nDoe, Jane',
+    'Anderson, Sandy and Band, Ann',
+])
+def test_split_names_like_bibtexparser(field):
+    expected = author({'author': field})['author']
+    assert getnames(authors.split_names(field)) == expected
+    assert authors.key_last_names(field) == tuple(
+        name.split(',')[0] for name in expected)
+
+
+def test_split_names_any_case():
+    assert authors.split_names('Fuchs, Jacob AND Doe, Jane') == [
+        'Fuchs, Jacob', 'Doe, Jane']
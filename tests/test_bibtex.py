@@ -0,0 +1,41 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from refmgr import bibtex
+from refmgr import entry
+
+ARTICLE = """\
+@article{Fuchs2020,
+  title = {First Paper},
+  author = {Fuchs, Jacob},
+  year = {2020}
+}
+"""
+
+
+def test_no_customizations_by_default(library):
+    assert not bibtex.Customizations.from_config()
+    bparser = bibtex.init_parser()
+    assert bparser.customization is None
+    [record] = bparser.parse(ARTICLE).entries
+    assert type(record) is dict
+
+
+def test_compact_entries(library):
+    bparser = bibtex.init_parser(compact=True)
+    [record] = bparser.parse(ARTICLE).entries
+    assert isinstance(record, entry.Entry)
+    assert record['title'] == 'First Paper'
@@ -0,0 +1,97 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import warnings
+
+from refmgr import conf
+
+COLLIDING_KEYS = """\
+@article{Fuchs2020,
+  title = {First Paper},
+  author = {Fuchs, Jacob},
+  year = {2020},
+  doi = {10.1/first}
+}
+
+@article{Fuchs2020,
+  title = {Second Paper},
+  author = {Fuchs, Jacob},
+  year = {2020},
+  doi = {10.1/second}
+}
+"""
+
+
+def _library_files(library):
+    return {path.name: path.read_text() for path in library.glob('*.bib')}
+
+
+def test_reimport_colliding_keys(library, refmgr, tmp_path):
+    source = tmp_path / 'a.bib'
+    source.write_text(COLLIDING_KEYS)
+
+    refmgr('import', '--single', str(source))
+    files = _library_files(library)
+    assert sorted(files) == ['Fuchs2020.bib', 'Fuchs2020a.bib']
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        refmgr('import', '--single', '--force', str(source))
+    assert _library_files(library) == files
+
+
+def _late_string_bib(count=150, at=120):
+    """Return a BibTeX file with `count` entries and an @string defined
+    before the entry `at`, which is used by the following entries."""
+    entries = [f'@article{{k{i},\n  title = {{Title {i}}},\n'
+               f'  author = {{Author, A.}},\n  year = {{2000}},\n'
+               f"  journal = {'jn' if i >= at else '{Journal}'}\n}}\n"
+               for i in range(count)]
+    entries.insert(at, '@string{jn = "Journal Name"}\n')
+    return '\n'.join(entries)
+
+
+def test_single_import_writes_all_strings(library, refmgr, tmp_path):
+    source = tmp_path / 'late.bib'
+    source.write_text(_late_string_bib())
+
+    refmgr('import', '--single', '-j', '1', str(source))
+    serial = _library_files(library)
+    assert len(serial) == 150
+    assert all('@string{jn = {Journal Name}}' in text
+               for text in serial.values())
+
+    parallel = tmp_path / 'parallel'
+    parallel.mkdir()
+    conf['library']['path'] = str(parallel)
+    refmgr('import', '--single', '-j', '2', str(source))
+    assert _library_files(parallel) == serial
+
+
+def test_single_import_independent_of_batch_size(library, refmgr, tmp_path):
+    source = tmp_path / 'late.bib'
+    source.write_text(_late_string_bib())
+
+    outputs = []
+    for batch_size in ('1', '7', '100'):
+        dirname = tmp_path / f'batch{batch_size}'
+        dirname.mkdir()
+        conf['library']['path'] = str(dirname)
+        conf.read_dict({'complete': {'batch_size': batch_size}})
+        refmgr('import', '--single', str(source))
+        outputs.append(_library_files(dirname))
+    assert outputs[0] == outputs[1] == outputs[2]
+    assert len(outputs[0]) == 150
@@ -0,0 +1,30 @@
+# This file is part of refmgr.
+# Copyright (C) 2021  Jacob Fuchs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import subprocess
+import sys
+
+
+def test_ui_imports_light_modules():
+    code = ('import sys, refmgr.ui; '
+            'print(" ".join(sorted(sys.modules)))')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    modules = subprocess.run([sys.executable, '-c', code], check=True,
+                             capture_output=True, text=True,
+                             env=env).stdout.split()
+    for heavy in ('refmgr.bibtex', 'bibtexparser', 'pyparsing', 'arxiv'):
+        assert heavy not in modules